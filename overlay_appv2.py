@@ -1,19 +1,27 @@
 import customtkinter as ctk
 import pyautogui
-import pytesseract
-try:
-    from openai import OpenAI  # Updated import statement
-except ImportError:
-    import openai  # Fallback import
 from PIL import Image, ImageSequence
 import subprocess
 import tempfile
-import os
-from PIL import ImageGrab
-from dotenv import load_dotenv  # You'll need to install this: pip install python-dotenv
+from PIL import ImageGrab, ImageTk, ImageEnhance
 import sys
 from pathlib import Path
-import json
+import threading
+import time
+import sqlite3
+from collections import OrderedDict
+import multiprocessing
+
+from study_helper_core.config import config
+from study_helper_core.client import api_client
+from study_helper_core.ocr import shutdown_ocr_pool
+from study_helper_core.cache import perceptual_hash, PerceptualIndex, ResponseCache
+from study_helper_core.engine import CaptureAnalysis, answer_follow_up
+from study_helper_core.semantic import create_semantic_index
+from study_helper_core.executor import RequestExecutor
+from study_helper_core.history import HistoryStore
+from study_helper_core.tracing import tracer, span
+from study_helper_core.cli import add_setting_arguments, setting_overrides
 
 # Define asset paths
 SCRIPT_DIR = Path(__file__).parent
@@ -26,43 +34,265 @@ ASSETS_DIR.mkdir(exist_ok=True)
 IMAGES_DIR.mkdir(exist_ok=True)
 GIFS_DIR.mkdir(exist_ok=True)
 
-# Load environment variables
-load_dotenv()
+# Background GIF frame cache
+GIF_SIZE_BUCKET = 100  # Sizes are rounded up to this many pixels so nearby sizes share frames
+GIF_CACHE_MAX_SIZES = 3  # Frame sets kept before the least recently used is dropped
+
+# Animation timing
+ANIMATION_FRAME_MS = 16  # Shortest gap between animation ticks (~60 FPS)
+GIF_MAX_LAG = 1.0  # Seconds behind schedule before the GIF restarts its clock
+
+HUD_REFRESH_INTERVAL = 0.25  # Seconds between performance HUD updates
+
+HISTORY_SEARCH_DELAY_MS = 150  # Wait for a pause in typing before searching
+
+CAPTURE_MIN_SIZE = 5  # Smaller region drags count as a click and cancel the capture
+
+# Clipboard watching after launching Snip & Sketch
+CLIPBOARD_POLL_MIN_MS = 50  # First poll interval, used again after every change
+CLIPBOARD_POLL_MAX_MS = 500  # Backoff limit while nothing happens
+
+class Prefetch:
+    """Background request started for a capture before Get Help was clicked"""
+    def __init__(self, analysis, request):
+        self.analysis = analysis
+        self.request = request
+
+class GifDecoder:
+    """Decode a GIF's frames on a background thread so the window can show immediately"""
+    def __init__(self, path):
+        self.path = path
+        self.frames = []  # RGBA frames decoded so far, in order
+        self.durations = []  # Display time of each frame in ms
+        self.done = False
+        self._thread = threading.Thread(target=self._decode, name="GifDecoder", daemon=True)
+        self._thread.start()
+
+    def _decode(self):
+        try:
+            with Image.open(self.path) as gif:
+                for frame in ImageSequence.Iterator(gif):
+                    # One RGBA conversion, shared by the light and dark images
+                    rgba = frame.convert('RGBA')
+                    # Duration first, so readers never see a frame without one
+                    self.durations.append(frame.info.get("duration") or 100)
+                    self.frames.append(rgba)
+        except Exception as e:
+            print(f"Failed to decode GIF {self.path}: {e}")
+        finally:
+            self.done = True
+
+class AnimationScheduler:
+    """Drive every UI animation from a single after() loop
+
+    Animations register a step(now) callable that updates its widgets and
+    returns how many seconds until it next needs a tick, or None when it is
+    finished. The loop only wakes up when the earliest animation is due,
+    never faster than one frame, and stops while the window is hidden.
+    """
+    def __init__(self, widget, frame_ms=ANIMATION_FRAME_MS):
+        self.widget = widget
+        self.frame_ms = frame_ms
+        self._animations = {}
+        self._after_id = None
+        self._due = None
+        self._paused = False
+
+    def add(self, name, step):
+        """Start an animation, replacing any running one with the same name"""
+        self._animations[name] = step
+        self._schedule(0)
+
+    def remove(self, name):
+        """Stop an animation"""
+        self._animations.pop(name, None)
+
+    def pause(self):
+        """Stop ticking, e.g. while the window is minimized"""
+        self._paused = True
+        self._cancel()
+
+    def resume(self):
+        """Start ticking again after pause()"""
+        if self._paused:
+            self._paused = False
+            self._schedule(0)
+
+    def _cancel(self):
+        if self._after_id is not None:
+            self.widget.after_cancel(self._after_id)
+            self._after_id = None
+            self._due = None
+
+    def _schedule(self, delay):
+        if self._paused or not self._animations:
+            return
+        delay_ms = max(self.frame_ms, int(delay * 1000))
+        due = time.perf_counter() + delay_ms / 1000
+        # An earlier tick is already booked
+        if self._after_id is not None and self._due <= due:
+            return
+        self._cancel()
+        self._due = due
+        self._after_id = self.widget.after(delay_ms, self._tick)
+
+    def _tick(self):
+        now = time.perf_counter()
+        # How late Tk ran us - a busy event loop shows up here first
+        if self._due is not None:
+            tracer.counter("ui.loop_lag", max(0.0, now - self._due) * 1000)
+        self._after_id = None
+        self._due = None
+
+        next_delay = None
+        with span("ui.frame", "ui"):
+            for name, step in list(self._animations.items()):
+                try:
+                    delay = step(now)
+                except Exception as e:
+                    print(f"Animation '{name}' failed: {e}")
+                    delay = None
+                if delay is None:
+                    # Only drop it if it wasn't replaced while running
+                    if self._animations.get(name) is step:
+                        del self._animations[name]
+                elif next_delay is None or delay < next_delay:
+                    next_delay = delay
 
-# Configure Tesseract path
-def get_tesseract_path():
-    default_paths = [
-        r"C:\Program Files\Tesseract-OCR\tesseract.exe",
-        r"C:\Program Files (x86)\Tesseract-OCR\tesseract.exe",
-        r"C:\Users\loush\AppData\Local\Programs\Tesseract-OCR\tesseract.exe"
+        if next_delay is not None:
+            self._schedule(next_delay)
+
+class PerformanceHUD:
+    """Corner readout of frame time, event-loop lag and the latest hot-path timings"""
+    ROWS = [
+        ("Frame", "ui.frame"),
+        ("Loop lag", "ui.loop_lag"),
+        ("Grab", "capture.grab"),
+        ("Clipboard", "capture.clipboard_grab"),
+        ("Preview", "capture.preview"),
+        ("Hash", "capture.phash"),
+        ("Encode", "image.prepare"),
+        ("Base64", "image.base64"),
+        ("OCR", "ocr.extract"),
+        ("1st token", "api.first_token"),
+        ("Request", "api.request"),
+        ("Render", "ui.render"),
+        ("GIF tick", "gif.tick"),
     ]
-    
-    for path in default_paths:
-        if os.path.exists(path):
-            return path
-    return None
-
-tesseract_path = get_tesseract_path()
-if tesseract_path:
-    pytesseract.pytesseract.tesseract_cmd = tesseract_path
-else:
-    print("Warning: Tesseract not found. OCR functionality may be limited.")
-
-# Configure OpenAI
-def get_api_key():
+
+    def __init__(self, window, animations):
+        self.window = window
+        self.animations = animations
+        self.visible = False
+        self.label = ctk.CTkLabel(
+            window,
+            text="",
+            font=("Consolas", 11),
+            justify="left",
+            anchor="w",
+            fg_color="#000000",
+            text_color="#7CFC00",
+            corner_radius=6
+        )
+
+    def toggle(self):
+        if self.visible:
+            self.hide()
+        else:
+            self.show()
+
+    def show(self):
+        self.visible = True
+        tracer.hud_active = True
+        self.label.place(relx=1.0, rely=0.0, x=-8, y=8, anchor="ne")
+        self.label.lift()
+        self.animations.add("perf_hud", self._update)
+
+    def hide(self):
+        self.visible = False
+        tracer.hud_active = False
+        self.animations.remove("perf_hud")
+        self.label.place_forget()
+
+    def _update(self, now):
+        if not self.visible:
+            return None
+        lines = []
+        for label, name in self.ROWS:
+            value = tracer.latest.get(name)
+            shown = f"{value:8.1f} ms" if value is not None else f"{'-':>8}   "
+            lines.append(f"{label:<10}{shown}")
+        self.label.configure(text="\n".join(lines))
+        self.label.lift()
+        return HUD_REFRESH_INTERVAL
+
+def clipboard_sequence_number():
+    """Windows' clipboard change counter, or None on other platforms"""
+    if sys.platform != "win32":
+        return None
     try:
-        with open("config.json", "r") as f:
-            config = json.load(f)
-            return config.get("api_key")
-    except (FileNotFoundError, json.JSONDecodeError):
+        import ctypes
+        return ctypes.windll.user32.GetClipboardSequenceNumber()
+    except (ImportError, AttributeError, OSError):
         return None
 
-api_key = get_api_key()
-if api_key:
-    try:
-        client = OpenAI(api_key=api_key)  # Create client instance
-    except NameError:
-        openai.api_key = api_key  # Fallback to old style
+class ClipboardWatcher:
+    """Wait for a new image to land on the clipboard and report it
+
+    Only Windows' clipboard sequence number is polled, which is nearly
+    free, and the clipboard is read once it changes. Snip mode only runs on
+    Windows; without the counter nothing is seen and the watch times out.
+    """
+    def __init__(self, widget, on_image, on_timeout, timeout_ms=None):
+        self.widget = widget
+        self.on_image = on_image
+        self.on_timeout = on_timeout
+        self.timeout_ms = timeout_ms
+        self._after_id = None
+
+    def start(self):
+        """Remember what's on the clipboard now and start watching for a change"""
+        self.stop()
+        self._sequence = clipboard_sequence_number()
+        self._delay = CLIPBOARD_POLL_MIN_MS
+        timeout_ms = self.timeout_ms or config.get("clipboard_timeout_ms")
+        self._deadline = time.monotonic() + timeout_ms / 1000
+        self._after_id = self.widget.after(self._delay, self._check)
+
+    def stop(self):
+        """Stop watching"""
+        if self._after_id is not None:
+            self.widget.after_cancel(self._after_id)
+            self._after_id = None
+
+    def _check(self):
+        self._after_id = None
+        image = None
+        changed = False
+        try:
+            sequence = clipboard_sequence_number()
+            if sequence is not None and sequence != self._sequence:
+                self._sequence = sequence
+                changed = True
+                content = ImageGrab.grabclipboard()
+                if isinstance(content, Image.Image):
+                    image = content
+        except Exception as e:
+            print(f"Clipboard check failed: {e}")
+
+        if image is not None:
+            self.on_image(image)
+            return
+        if time.monotonic() >= self._deadline:
+            self.on_timeout()
+            return
+
+        # Poll quickly right after activity, back off while it's quiet
+        if changed:
+            self._delay = CLIPBOARD_POLL_MIN_MS
+        else:
+            self._delay = min(int(self._delay * 1.5), CLIPBOARD_POLL_MAX_MS)
+        self._after_id = self.widget.after(self._delay, self._check)
 
 class APIKeyManager(ctk.CTkToplevel):
     def __init__(self, parent, callback, is_first_time=False):
@@ -214,16 +444,12 @@ class APIKeyManager(ctk.CTkToplevel):
             return
         
         try:
-            # Test the API key
-            openai.api_key = api_key
-            # Try a simple API call that doesn't cost tokens
-            openai.api_key = api_key
+            # Use the new key for every request from now on
+            api_client.set_api_key(api_key)
             
             # If we get here, the API key is valid
-            # Save to config.json instead of .env
-            config = {"api_key": api_key}
-            with open("config.json", "w") as f:
-                json.dump(config, f)
+            # Save to config.json instead of .env, keeping any other settings
+            config.update_file(api_key=api_key)
             
             # Check if running as exe or script
             if getattr(sys, 'frozen', False):
@@ -300,6 +526,254 @@ class APIKeyManager(ctk.CTkToplevel):
         self.destroy()
         self.master.deiconify()
 
+def grab_region(bbox):
+    """Grab only bbox (left, top, right, bottom) from the screen"""
+    try:
+        return ImageGrab.grab(bbox=bbox)
+    except OSError as pil_error:
+        # Pillow can't grab on every platform (e.g. Wayland); mss often can
+        try:
+            import mss
+        except ImportError:
+            raise pil_error
+        left, top, right, bottom = bbox
+        with mss.mss() as screen:
+            shot = screen.grab({
+                "left": left,
+                "top": top,
+                "width": right - left,
+                "height": bottom - top
+            })
+        return Image.frombytes("RGB", shot.size, shot.bgra, "raw", "BGRX")
+
+class RegionSelector(ctk.CTkToplevel):
+    """Fullscreen frozen screenshot for dragging out a capture rectangle
+
+    The screen is grabbed once before the window opens and the selection is
+    cropped from that image, so nothing depends on window transparency (which
+    X11 without a compositor doesn't have) and the overlay is never in the shot.
+    """
+    def __init__(self, parent, on_select, on_cancel):
+        screen_width = parent.winfo_screenwidth()
+        screen_height = parent.winfo_screenheight()
+        with span("capture.grab", "capture"):
+            screenshot = grab_region((0, 0, screen_width, screen_height))
+
+        super().__init__(parent)
+
+        self.on_select = on_select
+        self.on_cancel = on_cancel
+        self.screenshot = screenshot
+        # Scaled displays grab more pixels than Tk reports for the screen
+        self.scale = screenshot.size[0] / screen_width, screenshot.size[1] / screen_height
+        self.start = None
+        self.rect = None
+        self.selection = None
+        self.selection_photo = None
+        self.redraw_job = None  # Pending bright-selection redraw, at most one per frame
+
+        self.overrideredirect(True)
+        self.geometry(f"{screen_width}x{screen_height}+0+0")
+        self.attributes('-topmost', True)
+        self.configure(fg_color="#000000")
+
+        self.canvas = ctk.CTkCanvas(
+            self,
+            cursor="crosshair",
+            bg="#000000",
+            highlightthickness=0
+        )
+        self.canvas.pack(fill="both", expand=True)
+
+        # Dimmed everywhere but inside the selection
+        background = screenshot.convert("RGB")
+        if background.size != (screen_width, screen_height):
+            background = background.resize((screen_width, screen_height), Image.BILINEAR)
+        self.display = background
+        self.background_photo = ImageTk.PhotoImage(
+            ImageEnhance.Brightness(background).enhance(0.5), master=self
+        )
+        self.canvas.create_image(0, 0, image=self.background_photo, anchor="nw")
+
+        self.canvas.bind("<ButtonPress-1>", self.on_press)
+        self.canvas.bind("<B1-Motion>", self.on_drag)
+        self.canvas.bind("<ButtonRelease-1>", self.on_release)
+        self.bind("<Escape>", lambda event: self.cancel())
+
+        self.lift()
+        self.focus_force()
+
+    def on_press(self, event):
+        self.start = (event.x, event.y)
+        self.selection = self.canvas.create_image(event.x, event.y, anchor="nw")
+        self.rect = self.canvas.create_rectangle(
+            event.x, event.y, event.x, event.y,
+            outline="#4a9eff",
+            width=2
+        )
+
+    def _bbox(self, event):
+        x0, y0 = self.start
+        return min(x0, event.x), min(y0, event.y), max(x0, event.x), max(y0, event.y)
+
+    def on_drag(self, event):
+        if self.start is None:
+            return
+        self.canvas.coords(self.rect, *self._bbox(event))
+        # Motion events come much faster than frames, and each bright copy
+        # converts the whole selection, so only the latest one is drawn
+        if self.redraw_job is None:
+            self.redraw_job = self.after(ANIMATION_FRAME_MS, self._draw_selection)
+
+    def _draw_selection(self):
+        self.redraw_job = None
+        left, top, right, bottom = (round(value) for value in self.canvas.coords(self.rect))
+        if right > left and bottom > top:
+            self.selection_photo = ImageTk.PhotoImage(
+                self.display.crop((left, top, right, bottom)), master=self
+            )
+            self.canvas.coords(self.selection, left, top)
+            self.canvas.itemconfigure(self.selection, image=self.selection_photo)
+
+    def on_release(self, event):
+        if self.start is None:
+            return
+        self._cancel_redraw()
+        left, top, right, bottom = self._bbox(event)
+        if right - left < CAPTURE_MIN_SIZE or bottom - top < CAPTURE_MIN_SIZE:
+            self.cancel()
+            return
+
+        scale_x, scale_y = self.scale
+        image = self.screenshot.crop((
+            round(left * scale_x), round(top * scale_y),
+            round(right * scale_x), round(bottom * scale_y)
+        ))
+        self.destroy()
+        self.on_select(image)
+
+    def _cancel_redraw(self):
+        if self.redraw_job is not None:
+            self.after_cancel(self.redraw_job)
+            self.redraw_job = None
+
+    def cancel(self):
+        """Close without capturing"""
+        self._cancel_redraw()
+        self.destroy()
+        self.on_cancel(None)
+
+class HistoryPanel(ctk.CTkToplevel):
+    """Search past sessions and reopen one without asking again"""
+    def __init__(self, parent, store, on_open):
+        super().__init__(parent)
+        self.store = store
+        self.on_open = on_open
+        self.results = []
+        self.selected = None
+        self.thumbnails = {}  # Session id -> CTkImage, loaded when first shown
+        self.search_job = None
+
+        self.title("History")
+        self.geometry("520x640")
+        self.attributes('-topmost', True)
+        self.configure(fg_color="#1a1a1a")
+
+        self.search_entry = ctk.CTkEntry(
+            self,
+            placeholder_text="Search past questions and answers...",
+            font=("Arial", 13),
+            height=36,
+            corner_radius=8
+        )
+        self.search_entry.pack(fill="x", padx=15, pady=(15, 10))
+        self.search_entry.bind("<KeyRelease>", self._on_search_key)
+        self.search_entry.bind("<Return>", lambda event: self.open_selected())
+
+        self.result_frame = ctk.CTkScrollableFrame(self, fg_color="#232323", corner_radius=10)
+        self.result_frame.pack(fill="both", expand=True, padx=15)
+        self.result_buttons = []  # Reused between searches instead of rebuilt
+
+        # Preview of the selected session
+        self.preview_frame = ctk.CTkFrame(self, fg_color="#232323", corner_radius=10)
+        self.preview_frame.pack(fill="x", padx=15, pady=10)
+        self.thumbnail_label = ctk.CTkLabel(self.preview_frame, text="")
+        self.thumbnail_label.pack(side="left", padx=10, pady=10)
+        self.open_btn = ctk.CTkButton(
+            self.preview_frame,
+            text="Open",
+            command=self.open_selected,
+            font=("Arial Bold", 13),
+            width=100,
+            height=36,
+            corner_radius=8,
+            fg_color="#50c878",
+            hover_color="#3da75d",
+            state="disabled"
+        )
+        self.open_btn.pack(side="right", padx=10)
+
+        self.bind("<Escape>", lambda event: self.destroy())
+        self._search()
+        self.search_entry.focus_set()
+
+    def _on_search_key(self, event):
+        if event.keysym in ("Return", "Escape"):
+            return
+        if self.search_job is not None:
+            self.after_cancel(self.search_job)
+        self.search_job = self.after(HISTORY_SEARCH_DELAY_MS, self._search)
+
+    def _search(self):
+        self.search_job = None
+        self.results = self.store.search(self.search_entry.get())
+        with span("ui.render", "ui", results=len(self.results)):
+            for index, summary in enumerate(self.results):
+                if index == len(self.result_buttons):
+                    self.result_buttons.append(ctk.CTkButton(
+                        self.result_frame,
+                        anchor="w",
+                        font=("Arial", 12),
+                        fg_color="#2d2d2d",
+                        hover_color="#3a3a3a",
+                        text_color="#e0e0e0",
+                        corner_radius=6
+                    ))
+                when = time.strftime("%d %b %Y %H:%M", time.localtime(summary.updated))
+                text = f"{summary.title}\n{when}"
+                if summary.snippet:
+                    text += f" - {' '.join(summary.snippet.split())}"
+                button = self.result_buttons[index]
+                button.configure(text=text, command=lambda index=index: self._select(index))
+                button.pack(fill="x", padx=5, pady=3)
+            for button in self.result_buttons[len(self.results):]:
+                button.pack_forget()
+        self._select(0 if self.results else None)
+
+    def _select(self, index):
+        """Highlight a result and show its thumbnail"""
+        for i, button in enumerate(self.result_buttons[:len(self.results)]):
+            button.configure(fg_color="#3d5afe" if i == index else "#2d2d2d")
+        self.selected = None if index is None else self.results[index]
+        self.open_btn.configure(state="normal" if self.selected else "disabled")
+        photo = None
+        if self.selected is not None:
+            session_id = self.selected.id
+            if session_id not in self.thumbnails:
+                image = self.store.thumbnail(session_id)
+                self.thumbnails[session_id] = image and ctk.CTkImage(
+                    light_image=image, dark_image=image, size=image.size
+                )
+            photo = self.thumbnails[session_id]
+        self.thumbnail_label.configure(image=photo, text="" if photo else "No preview")
+        self.thumbnail_label.image = photo
+
+    def open_selected(self):
+        if self.selected is not None:
+            session_id = self.selected.id
+            self.destroy()
+            self.on_open(session_id)
+
 class StudyHelper(ctk.CTk):
     def __init__(self):
         super().__init__()
@@ -320,24 +794,15 @@ class StudyHelper(ctk.CTk):
     def check_api_key(self):
         """Check if API key exists and is valid"""
         try:
-            # Load from config.json instead of .env
-            import json
-            try:
-                with open("config.json", "r") as f:
-                    config = json.load(f)
-                    api_key = config.get("api_key")
-            except FileNotFoundError:
-                return False
-            
+            # Loaded once from config.json (or an override) at startup
+            api_key = config.get("api_key")
             if not api_key:
                 return False
                 
             if not api_key.startswith("sk-"):
                 return False
             
-            openai.api_key = api_key
-            # Try a simple API call that doesn't cost tokens
-            openai.api_key = api_key
+            api_client.set_api_key(api_key)
             return True
         except Exception as e:
             print(f"API key validation error: {str(e)}")
@@ -359,11 +824,70 @@ class StudyHelper(ctk.CTk):
         self.title("Study Helper")
         self.wm_attributes("-topmost", True)
         self.configure(fg_color="#1a1a1a")
+        self.protocol("WM_DELETE_WINDOW", self.on_closing)
+
+        # API calls run on background workers so the UI never freezes
+        self.requests = RequestExecutor(self)
+        if config.get("api_warm_up"):
+            api_client.warm_up()
+        self.analysis = None  # CaptureAnalysis behind the answer on screen
+        self.analysis_request = None
+        self.chat_request = None
+        self.prefetch = None
+
+        # Picks up the Snip & Sketch capture as soon as it reaches the clipboard
+        self.clipboard_watcher = ClipboardWatcher(
+            self,
+            on_image=self._on_clipboard_image,
+            on_timeout=self._on_clipboard_timeout
+        )
+
+        # Answers for screenshots we've already analyzed
+        self.response_cache = None
+        if config.get("cache_enabled"):
+            try:
+                self.response_cache = ResponseCache()
+            except OSError as e:
+                print(f"Response cache disabled: {e}")
+        self.capture_index = PerceptualIndex() if config.get("phash_enabled") else None
+
+        # Every conversation is saved so it can be found and reopened later
+        self.history = None
+        self.history_session = None
+        self.history_panel = None
+        if config.get("history_enabled"):
+            try:
+                self.history = HistoryStore()
+            except (OSError, sqlite3.Error) as e:
+                print(f"Session history disabled: {e}")
+
+        # Answers to similar questions asked before, loaded from the history in the background
+        self.semantic_index = create_semantic_index()
+        if self.semantic_index is not None and self.history is not None:
+            self.requests.submit(
+                lambda request: self.semantic_index.add_history(self.history),
+                on_error=lambda e: print(f"Failed to load past questions: {e}")
+            )
+
+        # One loop drives all animations and sleeps while the window is hidden
+        self.animations = AnimationScheduler(self)
+        self.bind("<Unmap>", self._on_unmap)
+        self.bind("<Map>", self._on_map)
+
+        # F12 shows where the time goes
+        self.hud = PerformanceHUD(self, self.animations)
+        self.bind("<F12>", lambda event: self.hud.toggle())
+        if config.get("perf_hud"):
+            self.hud.show()
 
         # Initialize GIF handling
         self.gif_frames = {}
         self.current_frames = {}
         self.is_playing = {}
+        self.gif_sources = {}  # GifDecoder per GIF
+        self.gif_sizes = {}  # Current display size per GIF
+        self.gif_next_frame_time = {}  # When each GIF's next frame is due
+        self.gif_frame_cache = OrderedDict()  # (name, size) -> CTkImage frames
         
         # Load GIFs
         self.load_gifs()
@@ -413,6 +937,23 @@ class StudyHelper(ctk.CTk):
         )
         self.api_key_btn.place(relx=0.95, rely=0.03, anchor="ne")  # Adjusted position to match padding
 
+        # Past sessions, also on Ctrl+H
+        self.history_btn = ctk.CTkButton(
+            self.main_frame,
+            text="History",
+            command=self.show_history,
+            width=120,
+            height=35,
+            corner_radius=8,
+            fg_color="#4a9eff",
+            hover_color="#2d7de0",
+            font=("Arial", 12, "bold"),
+            border_width=1,
+            border_color="#6ab0ff"
+        )
+        self.history_btn.place(relx=0.05, rely=0.03, anchor="nw")
+        self.bind("<Control-h>", lambda event: self.show_history())
+
         # Title with animation
         self.title_label = ctk.CTkLabel(
             self.main_frame,
@@ -503,33 +1044,62 @@ class StudyHelper(ctk.CTk):
             text="",
         )
 
+    def _on_unmap(self, event):
+        """Pause animations while the window is minimized or hidden"""
+        if event.widget is self and self.state() in ("iconic", "withdrawn"):
+            self.animations.pause()
+
+    def _on_map(self, event):
+        """Resume animations when the window is shown again"""
+        if event.widget is self:
+            self.animations.resume()
+
     def animate_title(self):
         """Animate the title with a fade-in effect"""
-        def update_opacity(step):
-            if step <= 10:  # 10 steps for animation
-                opacity = step / 10
-                # Convert opacity to hex color (from gray to white)
-                color_value = int(opacity * 255)
-                color = f"#{color_value:02x}{color_value:02x}{color_value:02x}"
-                self.title_label.configure(text_color=color)
-                self.after(50, lambda: update_opacity(step + 1))
-        update_opacity(0)
+        start = time.perf_counter()
+        duration = 0.5  # 10 steps of 50ms
+
+        def update_opacity(now):
+            # Time-based, so a late tick skips ahead instead of slowing down
+            opacity = min(1.0, (now - start) / duration)
+            # Convert opacity to hex color (from gray to white)
+            color_value = int(opacity * 255)
+            color = f"#{color_value:02x}{color_value:02x}{color_value:02x}"
+            self.title_label.configure(text_color=color)
+            return None if opacity >= 1.0 else 0.05
+
+        self.animations.add("title_fade", update_opacity)
 
     def update_status(self, text, color):
         """Animate status updates with a bounce effect"""
-        def bounce_animation(scale, step=0):
-            if step <= 5:  # 5 steps for bounce
-                # Calculate bounce scale (1.1 -> 1.0)
-                current_scale = 1 + (0.1 * (5 - step) / 5)
-                self.status_label.configure(font=("Arial", int(13 * current_scale)))
-                self.after(50, lambda: bounce_animation(scale, step + 1))
+        start = time.perf_counter()
+        font_size = [None]
+
+        def bounce_animation(now):
+            step = min(5, int((now - start) / 0.05))  # 5 steps of 50ms
+            # Calculate bounce scale (1.1 -> 1.0)
+            current_scale = 1 + (0.1 * (5 - step) / 5)
+            size = int(13 * current_scale)
+            if size != font_size[0]:
+                font_size[0] = size
+                self.status_label.configure(font=("Arial", size))
+            return None if step >= 5 else 0.05
             
         self.status_label.configure(text=text, text_color=color)
-        bounce_animation(1.1)
+        self.animations.add("status_bounce", bounce_animation)
 
     def capture_question(self):
-        """Capture and process question using Windows Snip & Sketch"""
+        """Capture and process question with the region selector or Snip & Sketch"""
         try:
+            # A capture that is still being waited for is replaced by this one
+            self.clipboard_watcher.stop()
+
+            if config.get("capture_mode") != "snip" or sys.platform != "win32":
+                # Hiding (not minimizing) skips the window manager's animation
+                self.withdraw()
+                self.after(100, self._open_region_selector)
+                return
+
             # Minimize window
             self.iconify()  # This minimizes the window instead of hiding it
             
@@ -540,6 +1110,31 @@ class StudyHelper(ctk.CTk):
             self.status_label.configure(text=f"Error: {str(e)}", text_color="red")
             self.deiconify()
 
+    def _open_region_selector(self):
+        """Grab the screen and show it fullscreen for the built-in region capture"""
+        try:
+            self.region_selector = RegionSelector(
+                self,
+                on_select=self._on_region_captured,
+                on_cancel=self._on_region_cancelled
+            )
+        except Exception as e:
+            # Usually the screen grab itself
+            self._on_region_cancelled(e)
+
+    def _on_region_captured(self, image):
+        """The built-in selector grabbed a region"""
+        self.deiconify()
+        self.process_clipboard(image)
+
+    def _on_region_cancelled(self, error):
+        """The selection was cancelled or the screen grab failed"""
+        self.deiconify()
+        if error is not None:
+            self.update_status(f"Screen capture failed: {str(error)}", "#ff6b6b")
+        else:
+            self.update_status("Capture cancelled", "#ff9800")
+
     def _launch_snip(self):
         """Launch Snip & Sketch and handle window restoration"""
         try:
@@ -552,21 +1147,35 @@ class StudyHelper(ctk.CTk):
                 text_color="orange"
             )
             
-            # Wait longer before restoring window to allow for screenshot
-            self.after(3000, self.deiconify)  # Wait 3 seconds before showing window
-            self.after(5000, self.process_clipboard)  # Process clipboard after 5 seconds
+            # Restore the window as soon as the capture lands on the clipboard
+            self.clipboard_watcher.start()
             
         except Exception as e:
             self.status_label.configure(text=f"Error: {str(e)}", text_color="red")
             self.deiconify()
 
-    def process_clipboard(self):
-        """Process the captured image from clipboard"""
+    def _on_clipboard_image(self, image):
+        """A new capture arrived on the clipboard"""
+        self.deiconify()
+        self.process_clipboard(image)
+
+    def _on_clipboard_timeout(self):
+        """No capture arrived in time"""
+        self.deiconify()
+        self.update_status("No capture detected. Click 'Capture Question' to try again.", "#ff9800")
+
+    def process_clipboard(self, screenshot=None):
+        """Process a captured image (read from the clipboard unless one is passed in)"""
         try:
-            # Get image from clipboard
-            screenshot = ImageGrab.grabclipboard()
+            # Get image from clipboard unless the watcher already read it
+            if screenshot is None:
+                with span("capture.clipboard_grab", "capture"):
+                    screenshot = ImageGrab.grabclipboard()
             
             if screenshot:
+                # Drop any analysis still running for the previous capture
+                self._cancel_requests()
+
                 # If we're in an expanded state, reset the UI
                 if hasattr(self, 'chat_container'):
                     # Reset window size
@@ -577,7 +1186,8 @@ class StudyHelper(ctk.CTk):
                     delattr(self, 'chat_container')
                     
                     # Clear conversation history
-                    self.conversation_history = []
+                    self.conversation = None
+                    self.history_session = None
                 
                 # Pack the image frame and get help button
                 self.image_frame.pack(pady=10, padx=20, fill="x")
@@ -593,29 +1203,37 @@ class StudyHelper(ctk.CTk):
                 
                 # Store the original screenshot
                 self.last_screenshot = screenshot
+                self.last_screenshot_phash = None
+                if self.capture_index is not None:
+                    with span("capture.phash", "capture"):
+                        self.last_screenshot_phash = perceptual_hash(screenshot)
                 
-                # Fixed reasonable size for display
-                max_width = 600
-                max_height = 200
+                with span("capture.preview", "ui", size=list(screenshot.size)):
+                    # Fixed reasonable size for display
+                    max_width = 600
+                    max_height = 200
                 
-                # Calculate scaling while maintaining aspect ratio
-                img_width, img_height = screenshot.size
-                scale = min(
-                    max_width / img_width,
-                    max_height / img_height
-                )
+                    # Calculate scaling while maintaining aspect ratio
+                    img_width, img_height = screenshot.size
+                    scale = min(
+                        max_width / img_width,
+                        max_height / img_height
+                    )
                 
-                display_width = int(img_width * scale)
-                display_height = int(img_height * scale)
+                    display_width = int(img_width * scale)
+                    display_height = int(img_height * scale)
                 
-                photo = ctk.CTkImage(
-                    light_image=screenshot, 
-                    dark_image=screenshot, 
-                    size=(display_width, display_height)
-                )
-                self.image_label.configure(image=photo)
-                self.image_label.image = photo
+                    photo = ctk.CTkImage(
+                        light_image=screenshot, 
+                        dark_image=screenshot, 
+                        size=(display_width, display_height)
+                    )
+                    self.image_label.configure(image=photo)
+                    self.image_label.image = photo
                 
+                # Get a head start while the user looks at the capture
+                self._start_prefetch()
+
                 # Update status
                 self.update_status("Question captured! Click 'Get Help' to proceed.", "#4caf50")
             else:
@@ -631,82 +1249,94 @@ class StudyHelper(ctk.CTk):
             return
 
         try:
-            # Animate window expansion
-            self._animate_window_expansion()
-            
-            # Create chat container frame
-            self.chat_container = ctk.CTkFrame(
-                self.main_frame,
-                fg_color="#232323",
-                corner_radius=10
-            )
-            self.chat_container.pack(fill="both", expand=True, padx=20, pady=10)
-            
-            # Chat history display - make it read-only
-            self.answer_text = ctk.CTkTextbox(
-                self.chat_container,
-                height=300,
-                font=("Arial", 12),
-                fg_color="#2d2d2d",
-                corner_radius=8,
-                wrap="word",
-                state="disabled"  # Make it read-only
-            )
-            self.answer_text.pack(fill="both", expand=True, padx=10, pady=5)
-            
-            # Add chat input area with placeholder
-            self.chat_frame = ctk.CTkFrame(
-                self.chat_container,
-                fg_color="transparent"
-            )
-            self.chat_frame.pack(fill="x", padx=10, pady=(0, 10), side="bottom")
-            
-            # Chat input with placeholder text - updated colors and text
-            self.chat_input = ctk.CTkTextbox(
-                self.chat_frame,
-                height=40,
-                font=("Arial", 12),
-                fg_color="#2d2d2d",
-                corner_radius=8,
-                wrap="word",
-                text_color="#e0e0e0"  # Lighter text color for better visibility
-            )
-            self.chat_input.pack(side="left", fill="x", expand=True, padx=(0, 5))
-            
-            # Add placeholder text and set cursor to beginning
-            self.chat_input.insert("0.0", "Type your question here...")
-            self.chat_input.configure(text_color="#666666")  # Dimmed placeholder text
-            self.chat_input.mark_set("insert", "0.0")  # Set cursor to beginning
-            self.chat_input.focus_set()  # Give focus to input box
-            
-            # Bind focus events for placeholder behavior
-            self.chat_input.bind("<FocusIn>", self._on_entry_click)
-            self.chat_input.bind("<FocusOut>", self._on_focus_out)
-            self.chat_input.bind("<Return>", self._on_enter_press)  # Enter to send
-            
-            # Improved send button
-            self.send_btn = ctk.CTkButton(
-                self.chat_frame,
-                text="Send ➤",  # Added arrow for better UX
-                command=self.send_message,
-                font=("Arial Bold", 13),
-                width=80,
-                height=40,
-                corner_radius=8,
-                fg_color="#2962ff",
-                hover_color="#1e88e5"
-            )
-            self.send_btn.pack(side="right")
-            
+            # Only one analysis per capture at a time
+            prefetch = self._take_prefetch()
+            self._cancel_requests()
+            if hasattr(self, 'chat_container'):
+                self.chat_container.destroy()
+
+            self._show_chat_view()
+
             # Store conversation history
-            self.conversation_history = []
+            self.conversation = None
+            self.history_session = None
             
             # Process initial analysis
-            self._process_image()
+            self._process_image(prefetch)
             
         except Exception as e:
             self.update_status(f"Error: {str(e)}", "#ff6b6b")
 
+    def _show_chat_view(self):
+        """Expand the window and add the answer box and chat input"""
+        # Animate window expansion
+        self._animate_window_expansion()
+        
+        # Create chat container frame
+        self.chat_container = ctk.CTkFrame(
+            self.main_frame,
+            fg_color="#232323",
+            corner_radius=10
+        )
+        self.chat_container.pack(fill="both", expand=True, padx=20, pady=10)
+        
+        # Chat history display - make it read-only
+        self.answer_text = ctk.CTkTextbox(
+            self.chat_container,
+            height=300,
+            font=("Arial", 12),
+            fg_color="#2d2d2d",
+            corner_radius=8,
+            wrap="word",
+            state="disabled"  # Make it read-only
+        )
+        self.answer_text.pack(fill="both", expand=True, padx=10, pady=5)
+        
+        # Add chat input area with placeholder
+        self.chat_frame = ctk.CTkFrame(
+            self.chat_container,
+            fg_color="transparent"
+        )
+        self.chat_frame.pack(fill="x", padx=10, pady=(0, 10), side="bottom")
+        
+        # Chat input with placeholder text - updated colors and text
+        self.chat_input = ctk.CTkTextbox(
+            self.chat_frame,
+            height=40,
+            font=("Arial", 12),
+            fg_color="#2d2d2d",
+            corner_radius=8,
+            wrap="word",
+            text_color="#e0e0e0"  # Lighter text color for better visibility
+        )
+        self.chat_input.pack(side="left", fill="x", expand=True, padx=(0, 5))
+        
+        # Add placeholder text and set cursor to beginning
+        self.chat_input.insert("0.0", "Type your question here...")
+        self.chat_input.configure(text_color="#666666")  # Dimmed placeholder text
+        self.chat_input.mark_set("insert", "0.0")  # Set cursor to beginning
+        self.chat_input.focus_set()  # Give focus to input box
+        
+        # Bind focus events for placeholder behavior
+        self.chat_input.bind("<FocusIn>", self._on_entry_click)
+        self.chat_input.bind("<FocusOut>", self._on_focus_out)
+        self.chat_input.bind("<Return>", self._on_enter_press)  # Enter to send
+        
+        # Improved send button
+        self.send_btn = ctk.CTkButton(
+            self.chat_frame,
+            text="Send ➤",  # Added arrow for better UX
+            command=self.send_message,
+            font=("Arial Bold", 13),
+            width=80,
+            height=40,
+            corner_radius=8,
+            fg_color="#2962ff",
+            hover_color="#1e88e5",
+            state="disabled"  # Enabled once the initial analysis arrives
+        )
+        self.send_btn.pack(side="right")
+
     def _on_entry_click(self, event):
         """Handle click on chat input"""
         # Clear placeholder text immediately when user clicks
@@ -729,116 +1359,165 @@ class StudyHelper(ctk.CTk):
             self.send_message()
             return "break"  # Prevents default newline
 
-    def _process_image(self):
-        """Process the initial image analysis"""
+    def _process_image(self, prefetch=None):
+        """Start the initial image analysis on a background worker
+
+        Work the prefetch for this capture already did is reused.
+        """
         try:
-            # Get API key from config.json
-            import json
-            try:
-                with open("config.json", "r") as f:
-                    config = json.load(f)
-                    api_key = config.get("api_key")
-            except FileNotFoundError:
+            # The shared client already holds the key from startup or the key manager
+            if not api_client.api_key:
                 self.update_status("API key not found. Please update it.", "#ff6b6b")
                 self.show_api_key_manager()
                 return
 
-            # Create new client instance with the API key
-            openai.api_key = api_key
+            analysis = None
+            if prefetch is not None and prefetch.analysis.screenshot is self.last_screenshot:
+                analysis = prefetch.analysis
+                if prefetch.request.active:
+                    # Still working - take over the request instead of starting again
+                    self._adopt_prefetch(prefetch)
+                    return
+            if analysis is None:
+                analysis = self._new_analysis()
+
+            self.update_status("Analyzing your question...", "#2196f3")
+            self.streamed_reply = False
+            self.analysis = analysis
+            self.analysis_request = self.requests.submit(
+                analysis.run,
+                on_done=self._on_analysis_done,
+                on_error=self._on_request_error,
+                on_delta=self._append_reply
+            )
 
-            # Convert PIL Image to bytes and encode
-            import io, base64
-            img_byte_arr = io.BytesIO()
-            self.last_screenshot.save(img_byte_arr, format='PNG')
-            base64_image = base64.b64encode(img_byte_arr.getvalue()).decode('utf-8')
-            
-            # Initial message with image - updated to be more general
-            initial_messages = [
-                {
-                    "role": "system",
-                    "content": """You are a highly knowledgeable AI assistant. Analyze the image provided and:
-                    1. Identify the type of question or content
-                    2. Provide a clear, detailed explanation
-                    3. If it's a question, provide the answer or solution
-                    4. If relevant, explain the reasoning or methodology
-                    Be thorough but concise in your responses."""
-                },
-                {
-                    "role": "user",
-                    "content": [
-                        {
-                            "type": "text",
-                            "text": "Please analyze this image and help me understand it."
-                        },
-                        {
-                            "type": "image_url",
-                            "image_url": {
-                                "url": f"data:image/png;base64,{base64_image}",
-                                "detail": "high"
-                            }
-                        }
-                    ]
-                }
-            ]
-            
-            # Load environment variables again in case they were updated
-            load_dotenv()
-            
-            # Update the API call based on which import was successful
-            try:
-                response = client.chat.completions.create(
-                    model="gpt-4o",
-                    messages=initial_messages,
-                    max_tokens=500
-                )
-                ai_message = response.choices[0].message.content
-            except NameError:
-                response = openai.ChatCompletion.create(
-                    model="gpt-4o",
-                    messages=initial_messages,
-                    max_tokens=500
-                )
-                ai_message = response['choices'][0]['message']['content']
-            
-            # Store the conversation
-            self.conversation_history = initial_messages + [
-                {"role": "assistant", "content": ai_message}
-            ]
-            
-            # Enable text widget temporarily to insert text
-            self.answer_text.configure(state="normal")
-            self.answer_text.delete("0.0", "end")
-            self.answer_text.insert("0.0", ai_message, "assistant")
-            self.answer_text.configure(state="disabled")
-            
-            # Update status
-            self.update_status("Analysis complete! You can now chat for more help.", "#4caf50")
-            
         except Exception as e:
-            error_msg = str(e)
-            if "API key" in error_msg or "authentication" in error_msg.lower():
-                self.update_status("API key is invalid or expired. Please update it.", "#ff6b6b")
-                self.show_api_key_manager()
-            else:
-                self.update_status(f"Error: {error_msg}", "#ff6b6b")
+            self._on_request_error(e)
+
+    def _new_analysis(self):
+        """CaptureAnalysis for the current capture"""
+        return CaptureAnalysis(
+            self.last_screenshot,
+            phash=self.last_screenshot_phash,
+            cache=self.response_cache,
+            capture_index=self.capture_index,
+            semantic_index=self.semantic_index
+        )
+
+    def _start_prefetch(self):
+        """Start preparing (and maybe answering) the capture before Get Help is clicked"""
+        mode = config.get("prefetch_mode")
+        if mode not in ("prepare", "analyze"):
+            return
+        analysis = self._new_analysis()
+        # Without a key there's nothing to send yet, but encoding and OCR still help
+        if mode == "analyze" and api_client.api_key:
+            job = analysis.run
+        else:
+            job = analysis.prepare
+        # Nothing is shown until get_help adopts the request
+        self.prefetch = Prefetch(analysis, self.requests.submit(
+            job,
+            on_error=lambda e: print(f"Prefetch failed: {e}")
+        ))
+
+    def _take_prefetch(self):
+        """Hand over the prefetch so _cancel_requests leaves it running"""
+        prefetch, self.prefetch = self.prefetch, None
+        return prefetch
+
+    def _adopt_prefetch(self, prefetch):
+        """Show a running prefetch as if get_help had started it"""
+        request = prefetch.request
+        request.on_error = self._on_request_error
+        if request.job == prefetch.analysis.run:
+            self.analysis = prefetch.analysis
+            # Whatever streamed so far is still buffered and shows on the next frame
+            request.on_done = self._on_analysis_done
+            request.on_delta = self._append_reply
+            self.analysis_request = request
+            self.update_status("Analyzing your question...", "#2196f3")
+        else:
+            # Only preparing - ask as soon as that's done
+            request.on_done = lambda analysis: self._process_image(self._take_prefetch())
+            self.prefetch = prefetch  # A new capture still cancels it
+            self.update_status("Preparing your question...", "#2196f3")
+        self.streamed_reply = False
+
+    def _on_analysis_done(self, result):
+        """Show the initial analysis (runs on the Tk thread)"""
+        if result is None:
+            return
+        conversation, ai_message, from_cache = result
+
+        # Store the conversation
+        self.conversation = conversation
+        self.conversation.add_assistant(ai_message)
+        if self.history is not None:
+            self.history_session = self.history.create_session(
+                self.last_screenshot, self.conversation.history
+            )
+
+        # Streamed replies are already on screen
+        if not self.streamed_reply:
+            with span("ui.render", "ui", chars=len(ai_message)):
+                self.answer_text.configure(state="normal")
+                self.answer_text.delete("0.0", "end")
+                self.answer_text.insert("0.0", ai_message, "assistant")
+                self.answer_text.configure(state="disabled")
+        self.send_btn.configure(state="normal")
+
+        # Update status
+        similar = self.analysis.similar if from_cache else None
+        if similar is not None:
+            self.update_status(
+                f"Reused the answer to a similar question ({similar.similarity:.0%} match)", "#4caf50"
+            )
+            if config.get("semantic_refresh"):
+                self._refresh_answer()
+        elif from_cache:
+            self.update_status("Loaded saved answer! You can now chat for more help.", "#4caf50")
+        else:
+            self.update_status("Analysis complete! You can now chat for more help.", "#4caf50")
+
+    def _refresh_answer(self):
+        """Ask for a fresh answer in the background after showing a reused one"""
+        conversation = self.conversation
+
+        def on_done(answer):
+            # Only if the user hasn't moved on or started asking follow-ups
+            if not answer or self.conversation is not conversation or len(conversation.history) != 3:
+                return
+            conversation.add_assistant(answer)
+            if self.history_session is not None:
+                self.history.add_messages(self.history_session, conversation.history[-1:])
+            with span("ui.render", "ui", chars=len(answer)):
+                self.answer_text.tag_config("assistant", foreground="#50c878")
+                self.answer_text.configure(state="normal")
+                self.answer_text.insert("end", "\n\nUpdated answer: ", "assistant")
+                self.answer_text.insert("end", answer, "assistant")
+                self.answer_text.see("end")
+                self.answer_text.configure(state="disabled")
+            self.update_status("Got a fresh answer!", "#4caf50")
+
+        self.analysis_request = self.requests.submit(
+            self.analysis.refresh,
+            on_done=on_done,
+            on_error=lambda e: print(f"Refreshing the answer failed: {e}")
+        )
 
     def send_message(self):
-        """Send a message and get response"""
+        """Send a message and get the response in the background"""
         try:
-            # Get API key from config.json
-            import json
-            try:
-                with open("config.json", "r") as f:
-                    config = json.load(f)
-                    api_key = config.get("api_key")
-            except FileNotFoundError:
+            # Follow-ups need the previous answer, so send one at a time
+            if self.send_btn.cget("state") == "disabled" or self.conversation is None:
+                return
+
+            if not api_client.api_key:
                 self.update_status("API key not found. Please update it.", "#ff6b6b")
                 self.show_api_key_manager()
                 return
 
-            # Create new client instance with the API key
-            openai.api_key = api_key
-
             # Get user message
             user_message = self.chat_input.get("0.0", "end").strip()
             if user_message == "Type your question here..." or not user_message:
@@ -854,100 +1533,161 @@ class StudyHelper(ctk.CTk):
             self.update_status("Processing your question...", "#2196f3")
             
             # Add user message to conversation
-            self.conversation_history.append({"role": "user", "content": user_message})
-            
-            # Load environment variables again in case they were updated
-            load_dotenv()
-            
-            # Update the API call based on which import was successful
-            try:
-                response = client.chat.completions.create(
-                    model="gpt-4o",
-                    messages=self.conversation_history,
-                    max_tokens=500
-                )
-                ai_message = response.choices[0].message.content
-            except NameError:
-                response = openai.ChatCompletion.create(
-                    model="gpt-4o",
-                    messages=self.conversation_history,
-                    max_tokens=500
-                )
-                ai_message = response['choices'][0]['message']['content']
-            
-            # Add response to conversation
-            self.conversation_history.append({"role": "assistant", "content": ai_message})
-            
+            self.conversation.add_user(user_message)
+
             # Update display with user message in a different color
             self.answer_text.tag_config("user", foreground="#4a9eff")
             self.answer_text.tag_config("assistant", foreground="#50c878")
-            
-            # Enable text widget temporarily to insert text
+
+            # Show the question right away while the answer is on its way
             self.answer_text.configure(state="normal")
             self.answer_text.insert("end", "\n\nYou: ", "user")
             self.answer_text.insert("end", user_message, "user")
-            self.answer_text.insert("end", "\n\nAssistant: ", "assistant")
-            self.answer_text.insert("end", ai_message, "assistant")
+            if config.get("stream_responses"):
+                self.answer_text.insert("end", "\n\nAssistant: ", "assistant")
             self.answer_text.see("end")
             self.answer_text.configure(state="disabled")
-            
-            # Update status
-            self.update_status("Ready for your next question!", "#4caf50")
+
+            # Trimming to the token budget (or finding an earlier answer) happens
+            # on the worker; the history isn't touched again until the reply arrives
+            conversation = self.conversation
+            self.send_btn.configure(state="disabled")
+            self.streamed_reply = False
+            self.chat_request = self.requests.submit(
+                lambda request: answer_follow_up(
+                    request, conversation, user_message, self.semantic_index
+                ),
+                on_done=self._on_chat_reply,
+                on_error=self._on_request_error,
+                on_delta=self._append_reply
+            )
             
         except Exception as e:
-            error_msg = str(e)
-            if "API key" in error_msg or "authentication" in error_msg.lower():
-                self.update_status("API key is invalid or expired. Please update it.", "#ff6b6b")
-                self.show_api_key_manager()
-            else:
-                self.update_status(f"Error: {error_msg}", "#ff6b6b")
+            self._on_request_error(e)
+
+    def _on_chat_reply(self, result):
+        """Show a follow-up answer (runs on the Tk thread)"""
+        ai_message, similar = result
+        # Add response to conversation
+        self.conversation.add_assistant(ai_message)
+        if self.history_session is not None:
+            self.history.add_messages(self.history_session, self.conversation.history[-2:])
+
+        # Streamed replies are already on screen
+        if not self.streamed_reply:
+            with span("ui.render", "ui", chars=len(ai_message)):
+                self.answer_text.configure(state="normal")
+                self.answer_text.insert("end", "\n\nAssistant: ", "assistant")
+                self.answer_text.insert("end", ai_message, "assistant")
+                self.answer_text.see("end")
+                self.answer_text.configure(state="disabled")
+        self.send_btn.configure(state="normal")
+
+        # Update status
+        if similar is not None:
+            self.update_status(
+                f"Reused the answer to a similar question ({similar.similarity:.0%} match)", "#4caf50"
+            )
+        else:
+            self.update_status("Ready for your next question!", "#4caf50")
+
+    def _append_reply(self, text):
+        """Append a batch of streamed reply text (one insert per frame)"""
+        self.streamed_reply = True
+        with span("ui.render", "ui", chars=len(text)):
+            self.answer_text.configure(state="normal")
+            self.answer_text.insert("end", text, "assistant")
+            self.answer_text.see("end")
+            self.answer_text.configure(state="disabled")
+
+    def _on_request_error(self, e):
+        """Report a failed API request (runs on the Tk thread)"""
+        # Follow-ups need an answered capture to follow up on
+        if (hasattr(self, 'send_btn') and self.send_btn.winfo_exists()
+                and getattr(self, 'conversation', None) is not None):
+            self.send_btn.configure(state="normal")
+        error_msg = str(e)
+        if "API key" in error_msg or "authentication" in error_msg.lower():
+            self.update_status("API key is invalid or expired. Please update it.", "#ff6b6b")
+            self.show_api_key_manager()
+        else:
+            self.update_status(f"Error: {error_msg}", "#ff6b6b")
+
+    def _cancel_requests(self):
+        """Cancel any prefetch, analysis or follow-up still in flight"""
+        if self.prefetch is not None:
+            self.prefetch.request.cancel()
+        for request in (self.analysis_request, self.chat_request):
+            if request is not None:
+                request.cancel()
+        self.prefetch = None
+        self.analysis_request = None
+        self.chat_request = None
 
     def _animate_window_expansion(self):
         """Animate the window expansion smoothly"""
         current_height = 600
         target_height = 1100  # Increased from 1000 to 1100 for better chat visibility
-        steps = 20  # More steps for smoother animation
-        height_increment = (target_height - current_height) / steps
-        
-        def expand_step(current):
-            if current < target_height:
-                next_height = min(current + height_increment, target_height)
-                self.geometry(f"800x{int(next_height)}")
-                
-                # Resize GIF frames for new window size
-                self.resize_background_gif(800, int(next_height))
-                
-                self.after(16, lambda: expand_step(next_height))  # Exactly 16ms for 60 FPS
+        duration = 20 * 0.016  # Same pace as the old 20 steps of 16ms
+        start = time.perf_counter()
+        last_height = [current_height]
+
+        # Size the GIF for the final window once; it covers every step on the way
+        self.resize_background_gif(800, target_height)
         
-        expand_step(current_height)
+        def expand_step(now):
+            # Height follows the clock, so dropped frames don't slow it down
+            progress = min(1.0, (now - start) / duration)
+            next_height = int(current_height + (target_height - current_height) * progress)
+            if next_height != last_height[0]:
+                last_height[0] = next_height
+                self.geometry(f"800x{next_height}")
+            return None if progress >= 1.0 else 0
+
+        self.animations.add("window_expansion", expand_step)
 
     def resize_background_gif(self, width, height):
         """Resize the background GIF frames to match window size"""
         if "loading" in self.gif_frames:
-            frames = []
             # Make the GIF larger than the window to ensure full coverage
             target_size = (width + 400, height + 400)  # Increased padding
-            
-            # Get original frames
-            original_frames = self.gif_frames["loading"]
-            
-            # Resize each frame
-            for frame in original_frames:
-                frame_image = ctk.CTkImage(
-                    light_image=frame._light_image,
-                    dark_image=frame._dark_image,
-                    size=target_size
-                )
-                frames.append(frame_image)
-            
+
+            frames = self._get_gif_frames("loading", target_size)
+            if frames is self.gif_frames["loading"]:
+                return  # Already showing this size
+
             # Update frames
             self.gif_frames["loading"] = frames
+            self.gif_sizes["loading"] = target_size
             
             # Force update the current frame
-            if self.is_playing.get("loading", False):
-                current_frame = self.current_frames["loading"]
+            if self.is_playing.get("loading", False) and frames:
+                current_frame = self.current_frames["loading"] % len(frames)
                 self.background_gif.configure(image=frames[current_frame])
 
+    def _get_gif_frames(self, name, size):
+        """Return CTkImage frames for a GIF at (roughly) size, building them at most once"""
+        # Round up so the frames still cover the requested size
+        bucket = GIF_SIZE_BUCKET
+        size = tuple(-(-dimension // bucket) * bucket for dimension in size)
+        key = (name, size)
+
+        frames = self.gif_frame_cache.get(key)
+        if frames is None:
+            frames = []
+            self.gif_frame_cache[key] = frames
+            # CTkImage keeps a scaled copy of every frame, so bound the memory
+            while len(self.gif_frame_cache) > GIF_CACHE_MAX_SIZES:
+                self.gif_frame_cache.popitem(last=False)
+        else:
+            self.gif_frame_cache.move_to_end(key)
+
+        # Top up with frames the decoder has finished since the last call
+        decoded = self.gif_sources[name].frames
+        for frame in decoded[len(frames):]:
+            frames.append(ctk.CTkImage(light_image=frame, dark_image=frame, size=size))
+        return frames
+
     def load_gifs(self):
         """Load all GIFs from the gifs directory"""
         try:
@@ -969,12 +1709,6 @@ class StudyHelper(ctk.CTk):
     def load_gif(self, name, path):
         """Load a specific GIF and store its frames"""
         if path.exists():
-            frames = []
-            gif = Image.open(path)
-            
-            # Get frame dimensions
-            width, height = gif.size
-            
             # Different sizes for background vs loading indicator
             if name == "loading":
                 # Initial size slightly larger than window
@@ -982,16 +1716,11 @@ class StudyHelper(ctk.CTk):
             else:
                 target_size = (50, 50)  # Small size for loading indicator
             
-            for frame in ImageSequence.Iterator(gif):
-                # Convert and resize frame
-                frame_image = ctk.CTkImage(
-                    light_image=frame.convert('RGBA'),
-                    dark_image=frame.convert('RGBA'),
-                    size=target_size
-                )
-                frames.append(frame_image)
-            
-            self.gif_frames[name] = frames
+            # Frames arrive in the background; the animation plays whatever is
+            # ready and the empty label is the placeholder until then
+            self.gif_sources[name] = GifDecoder(path)
+            self.gif_sizes[name] = target_size
+            self.gif_frames[name] = self._get_gif_frames(name, target_size)
             self.current_frames[name] = 0
             self.is_playing[name] = False
 
@@ -999,30 +1728,133 @@ class StudyHelper(ctk.CTk):
         """Play a specific GIF on a widget"""
         if name in self.gif_frames and not self.is_playing.get(name, False):
             self.is_playing[name] = True
-            self._animate_gif(name, widget)
+            self.gif_next_frame_time[name] = time.perf_counter()
+            self.animations.add(
+                f"gif:{name}",
+                lambda now: self._traced_gif_tick(name, widget, now)
+            )
 
     def stop_gif(self, name):
         """Stop a specific GIF animation"""
         self.is_playing[name] = False
+        self.animations.remove(f"gif:{name}")
 
-    def _animate_gif(self, name, widget):
-        """Animate a specific GIF frame by frame"""
-        if self.is_playing.get(name, False) and name in self.gif_frames:
-            frames = self.gif_frames[name]
-            if frames:
-                # Update to next frame
-                self.current_frames[name] = (self.current_frames[name] + 1) % len(frames)
-                widget.configure(image=frames[self.current_frames[name]])
-                
-                # Exactly 16ms for consistent 60 FPS
-                self.after(16, lambda: self._animate_gif(name, widget))
+    def _traced_gif_tick(self, name, widget, now):
+        with span("gif.tick", "ui", gif=name):
+            return self._animate_gif(name, widget, now)
+
+    def _animate_gif(self, name, widget, now):
+        """Show the GIF frame that is due now; returns seconds until the next one"""
+        if not self.is_playing.get(name, False) or name not in self.gif_frames:
+            return None
+
+        # Pick up frames decoded since the last tick
+        frames = self._get_gif_frames(name, self.gif_sizes[name])
+        self.gif_frames[name] = frames
+        if not frames:
+            return 0.05  # Still decoding the first frame
+
+        next_time = self.gif_next_frame_time[name]
+        if now < next_time:
+            return next_time - now
+
+        # After a long stall (e.g. a resize) start timing again from now
+        if now - next_time > GIF_MAX_LAG:
+            next_time = now
+
+        # Honor each frame's duration and skip frames we're too late for
+        durations = self.gif_sources[name].durations
+        index = self.current_frames[name]
+        while next_time <= now:
+            index = (index + 1) % len(frames)
+            next_time += durations[index] / 1000
+
+        self.current_frames[name] = index
+        self.gif_next_frame_time[name] = next_time
+        widget.configure(image=frames[index])
+        return next_time - now
+
+    def show_history(self):
+        """Open the search panel for past sessions"""
+        if self.history is None:
+            self.update_status("Session history is turned off", "#ff9800")
+            return
+        if self.history_panel is not None and self.history_panel.winfo_exists():
+            self.history_panel.lift()
+            self.history_panel.search_entry.focus_set()
+            return
+        self.history_panel = HistoryPanel(self, self.history, self.open_history_session)
+
+    def open_history_session(self, session_id):
+        """Show a past session and carry on chatting in it, without calling the API"""
+        try:
+            conversation = self.history.restore(session_id)
+            if conversation is None:
+                self.update_status("That session could not be loaded", "#ff6b6b")
+                return
+
+            self._cancel_requests()
+            if hasattr(self, 'chat_container'):
+                self.chat_container.destroy()
+            self._show_chat_view()
+            self.conversation = conversation
+            self.history_session = session_id
+
+            # The capture itself isn't kept, only its thumbnail
+            self.get_help_btn.pack_forget()
+            thumbnail = self.history.thumbnail(session_id)
+            if thumbnail is not None:
+                photo = ctk.CTkImage(light_image=thumbnail, dark_image=thumbnail, size=thumbnail.size)
+                self.image_label.configure(image=photo)
+                self.image_label.image = photo
+                self.image_frame.pack(pady=10, padx=20, fill="x")
+            else:
+                self.image_frame.pack_forget()
+
+            with span("ui.render", "ui", messages=len(conversation.history)):
+                self.answer_text.tag_config("user", foreground="#4a9eff")
+                self.answer_text.tag_config("assistant", foreground="#50c878")
+                self.answer_text.configure(state="normal")
+                for index, message in enumerate(conversation.history[2:]):
+                    if message["role"] == "user":
+                        self.answer_text.insert("end", "\n\nYou: " + message["content"], "user")
+                    elif index == 0:
+                        self.answer_text.insert("end", message["content"], "assistant")
+                    else:
+                        self.answer_text.insert("end", "\n\nAssistant: " + message["content"], "assistant")
+                self.answer_text.see("end")
+                self.answer_text.configure(state="disabled")
+            self.send_btn.configure(state="normal")
+            self.update_status("Reopened a saved session! You can keep chatting.", "#4caf50")
+
+        except Exception as e:
+            self.update_status(f"Error: {str(e)}", "#ff6b6b")
 
     def show_api_key_manager(self):
         """Show the API key manager for updates"""
         self.withdraw()  # Hide main window
         self.api_key_manager = APIKeyManager(self, self.on_api_key_setup, is_first_time=False)
 
+    def on_closing(self):
+        """Stop background work before closing the window"""
+        self.requests.shutdown()
+        self.clipboard_watcher.stop()
+        shutdown_ocr_pool()
+        if self.history is not None:
+            self.history.close()
+        tracer.flush()
+        self.destroy()
+
+def parse_args(argv=None):
+    """Command line overrides for config.json settings"""
+    import argparse
+    parser = argparse.ArgumentParser(description="Study Helper overlay")
+    add_setting_arguments(parser)
+    return setting_overrides(parser, parser.parse_args(argv))
+
 if __name__ == "__main__":
+    multiprocessing.freeze_support()  # Needed for the OCR process pool in the exe
+    config.set_overrides(parse_args())
     ctk.set_appearance_mode("dark")
     app = StudyHelper()
     app.mainloop()
\ No newline at end of file
@@ -0,0 +1,17 @@
+"""Study Helper without the window: capture analysis, follow-ups and settings
+
+    from study_helper_core import Engine
+    session = Engine().analyze("question.png")
+    print(session.answer)
+"""
+# The settings instance is study_helper_core.config.config; re-exporting it here
+# would hide the config submodule behind it
+from .config import Config, DEFAULT_CONFIG
+from .client import api_client, APIClient
+from .engine import CaptureAnalysis, Engine, Request, Session
+
+__all__ = [
+    "Config", "DEFAULT_CONFIG",
+    "api_client", "APIClient",
+    "CaptureAnalysis", "Engine", "Request", "Session",
+]
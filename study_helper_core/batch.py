@@ -0,0 +1,156 @@
+"""Batch mode: answer a whole folder of screenshots into a resumable JSONL file
+
+    python -m study_helper_core.batch problem_set/ --output answers.jsonl --workers 4
+
+Finished images are skipped when the same output file is used again, so an
+interrupted run picks up where it stopped. Failed images are tried again.
+"""
+import sys
+import json
+import time
+import argparse
+import contextlib
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from .config import config
+from .client import api_client
+from .ocr import shutdown_ocr_pool
+from .engine import Engine
+from .cli import add_setting_arguments, setting_overrides, find_images
+
+def finished_images(output_path):
+    """Images that already have a successful result in output_path"""
+    finished = set()
+    try:
+        with open(output_path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue  # A line cut short by an interrupted run
+                if record.get("status") == "ok":
+                    finished.add(record["image"])
+    except FileNotFoundError:
+        pass
+    return finished
+
+class BatchRunner:
+    """Analyse images on a bounded pool of workers
+
+    Rate limiting and retries happen in run_chat_request and are shared by
+    all workers, so a 429 on one image holds the others back too.
+    """
+    def __init__(self, engine, workers):
+        self.engine = engine
+        self.workers = workers
+
+    def process(self, image):
+        """Result record for one image; never raises"""
+        started = time.perf_counter()
+        try:
+            session = self.engine.analyze(image)
+        except Exception as e:
+            return {
+                "image": image,
+                "status": "error",
+                "error": f"{type(e).__name__}: {e}",
+                "seconds": round(time.perf_counter() - started, 3)
+            }
+        return {
+            "image": image,
+            "status": "ok",
+            "answer": session.answer,
+            "from_cache": session.from_cache,
+            "model": session.route.model,
+            "seconds": round(time.perf_counter() - started, 3)
+        }
+
+    def run(self, images, on_result):
+        """Process images, calling on_result(record) on this thread as each finishes"""
+        pending = set()
+        images = iter(images)
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="StudyHelperBatch") as pool:
+            try:
+                while True:
+                    # Keep only a couple of images per worker queued at a time
+                    while len(pending) < self.workers * 2:
+                        image = next(images, None)
+                        if image is None:
+                            break
+                        pending.add(pool.submit(self.process, image))
+                    if not pending:
+                        break
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        on_result(future.result())
+            except KeyboardInterrupt:
+                # Finished results are already written; drop what hasn't started
+                for future in pending:
+                    future.cancel()
+                raise
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="python -m study_helper_core.batch",
+        description="Answer every screenshot in a folder, writing one JSON line per image"
+    )
+    parser.add_argument("paths", nargs="+", help="Image files, globs or directories of images")
+    parser.add_argument("-o", "--output", required=True, help="JSONL file to write (and resume from)")
+    parser.add_argument("-w", "--workers", type=int, default=4, help="Images processed at the same time")
+    parser.add_argument("--retries", type=int, help="Retries for rate limits and timeouts")
+    add_setting_arguments(parser)
+    args = parser.parse_args(argv)
+    overrides = setting_overrides(parser, args)
+    # One pooled connection per worker
+    overrides.setdefault("max_concurrent_requests", args.workers)
+    if args.retries is not None:
+        overrides["api_max_retries"] = args.retries
+    return args, overrides
+
+def main(argv=None):
+    args, overrides = parse_args(argv)
+    config.set_overrides(overrides)
+    if not api_client.api_key:
+        print("No API key: set api_key in config.json or STUDY_HELPER_API_KEY", file=sys.stderr)
+        return 2
+
+    # Progress goes to stderr so stdout stays free for the summary
+    with contextlib.redirect_stdout(sys.stderr):
+        finished = finished_images(args.output)
+        images = []
+        for path in find_images(args.paths):
+            image = str(Path(path).resolve())
+            if image not in finished:
+                images.append(image)
+        print(f"{len(images)} images to process, {len(finished)} already done")
+
+        counts = {"ok": 0, "error": 0}
+        started = time.perf_counter()
+        runner = BatchRunner(Engine(), max(1, args.workers))
+        with open(args.output, "a", encoding="utf-8") as output:
+            def write(record):
+                # One complete line per result so a crash loses at most the current one
+                output.write(json.dumps(record) + "\n")
+                output.flush()
+                counts[record["status"]] += 1
+                done = counts["ok"] + counts["error"]
+                print(f"[{done}/{len(images)}] {record['status']}: {record['image']}")
+
+            try:
+                runner.run(images, write)
+            except KeyboardInterrupt:
+                print("Interrupted - run the same command again to continue")
+                return 130
+            finally:
+                shutdown_ocr_pool()
+
+    elapsed = time.perf_counter() - started
+    print(f"{counts['ok']} done, {counts['error']} failed, "
+          f"{len(finished)} skipped in {elapsed:.1f}s")
+    return 1 if counts["error"] else 0
+
+if __name__ == "__main__":
+    import multiprocessing
+    multiprocessing.freeze_support()  # Needed for the OCR process pool
+    sys.exit(main())
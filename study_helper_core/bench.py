@@ -0,0 +1,294 @@
+"""End-to-end latency benchmark against the mock API, no key or network needed
+
+    python -m study_helper_core.bench --runs 10
+    python -m study_helper_core.bench --json bench.json            # save results
+    python -m study_helper_core.bench --baseline bench.json        # fail on regressions
+
+Runs the same steps as process_clipboard, _process_image and send_message
+in overlay_appv2.py, with a stand-in event loop in place of Tk so the time
+spent on the UI thread can be measured as well.
+"""
+import io
+import sys
+import json
+import time
+import heapq
+import random
+import argparse
+import itertools
+import tracemalloc
+import contextlib
+from PIL import Image, ImageDraw
+
+from .config import config
+from .cache import perceptual_hash
+from .imaging import prepare_image
+from .client import request_body
+from .prompts import build_image_messages
+from .engine import CaptureAnalysis, answer_follow_up
+from .executor import RequestExecutor
+from .ocr import shutdown_ocr_pool
+from .mock_server import MockServer, MockSettings
+from .cli import find_images
+
+# Metrics where a bigger number is worse, with their units
+METRICS = [
+    ("capture_ui_ms", "Capture: perceptual hash on the UI thread"),
+    ("encode_ms", "Image preparation (resize + encode)"),
+    ("payload_kb", "Request body size"),
+    ("encode_peak_kb", "Peak memory building the request"),
+    ("analyze_ui_ms", "Analysis: longest UI thread callback"),
+    ("analyze_ttft_ms", "Analysis: time to first token"),
+    ("analyze_total_ms", "Analysis: total latency"),
+    ("follow_up_ui_ms", "Follow-up: longest UI thread callback"),
+    ("follow_up_ttft_ms", "Follow-up: time to first token"),
+    ("follow_up_total_ms", "Follow-up: total latency"),
+]
+FOLLOW_UP_QUESTION = "Can you explain the second step in more detail?"
+
+class UILoop:
+    """Single-threaded stand-in for Tk's event loop that times every callback"""
+    def __init__(self):
+        self._timers = []  # (due, id, callback, args)
+        self._ids = itertools.count()
+        self._cancelled = set()
+        self.durations = []  # Seconds spent in each callback since the last reset
+
+    def after(self, ms, callback, *args):
+        timer_id = next(self._ids)
+        heapq.heappush(self._timers, (time.perf_counter() + ms / 1000, timer_id, callback, args))
+        return timer_id
+
+    def after_cancel(self, timer_id):
+        self._cancelled.add(timer_id)
+
+    def call(self, callback, *args):
+        """Run callback now, as if from a button press"""
+        started = time.perf_counter()
+        try:
+            return callback(*args)
+        finally:
+            self.durations.append(time.perf_counter() - started)
+
+    def run_until(self, done, timeout=60):
+        """Process timers until done() is true"""
+        deadline = time.perf_counter() + timeout
+        while not done():
+            if time.perf_counter() > deadline:
+                raise TimeoutError("Benchmark step did not finish")
+            if not self._timers:
+                time.sleep(0.001)
+                continue
+            due, timer_id, callback, args = heapq.heappop(self._timers)
+            if timer_id in self._cancelled:
+                self._cancelled.discard(timer_id)
+                continue
+            delay = due - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            self.call(callback, *args)
+
+    def take_max_duration(self):
+        longest = max(self.durations, default=0.0)
+        self.durations = []
+        return longest
+
+def sample_images():
+    """A text-only capture and a photo-like one, the same on every run"""
+    text = Image.new("RGB", (1400, 500), "white")
+    draw = ImageDraw.Draw(text)
+    rng = random.Random(0)
+    for line in range(18):
+        words = " ".join(f"word{rng.randint(0, 999)}" for _ in range(14))
+        draw.text((20, 20 + line * 26), f"{line + 1}. {words}", fill="black")
+
+    photo = Image.linear_gradient("L").resize((1920, 1080)).convert("RGB")
+    noise = Image.effect_noise((1920, 1080), 40).convert("RGB")
+    photo = Image.blend(photo, noise, 0.5)
+    return [("text", text), ("photo", photo)]
+
+def measure(loop, executor, name, image):
+    """One capture -> answer -> follow-up round trip; returns its metrics"""
+    metrics = {}
+
+    # process_clipboard hashes the capture on the UI thread
+    loop.take_max_duration()
+    phash = loop.call(perceptual_hash, image)
+    metrics["capture_ui_ms"] = loop.take_max_duration() * 1000
+
+    started = time.perf_counter()
+    prepared = prepare_image(image)
+    metrics["encode_ms"] = (time.perf_counter() - started) * 1000
+    metrics["payload_kb"] = len(
+        request_body(model=config.get("model"), messages=build_image_messages(prepared))
+    ) / 1024
+
+    # Separate pass, tracemalloc would skew the timing above
+    tracemalloc.start()
+    try:
+        request_body(model=config.get("model"), messages=build_image_messages(prepare_image(image)))
+        metrics["encode_peak_kb"] = tracemalloc.get_traced_memory()[1] / 1024
+    finally:
+        tracemalloc.stop()
+
+    def run_request(submit):
+        state = {"first": None, "result": None, "error": None, "done": False}
+
+        def on_delta(text):
+            if state["first"] is None:
+                state["first"] = time.perf_counter()
+
+        def on_done(result):
+            state["result"] = result
+            state["done"] = True
+
+        def on_error(e):
+            state["error"] = e
+            state["done"] = True
+
+        started = time.perf_counter()
+        loop.call(submit, on_done, on_error, on_delta)
+        loop.run_until(lambda: state["done"])
+        if state["error"] is not None:
+            raise state["error"]
+        finished = time.perf_counter()
+        first = state["first"] or finished
+        return state["result"], (first - started) * 1000, (finished - started) * 1000
+
+    # _process_image: build the analysis and hand it to a worker
+    def submit_analysis(on_done, on_error, on_delta):
+        analysis = CaptureAnalysis(image, phash=phash)
+        executor.submit(analysis.run, on_done=on_done, on_error=on_error, on_delta=on_delta)
+
+    result, ttft, total = run_request(submit_analysis)
+    metrics["analyze_ui_ms"] = loop.take_max_duration() * 1000
+    metrics["analyze_ttft_ms"] = ttft
+    metrics["analyze_total_ms"] = total
+    conversation, answer, _ = result
+    conversation.add_assistant(answer)
+
+    # send_message: record the question and trim the context on the worker
+    def submit_follow_up(on_done, on_error, on_delta):
+        conversation.add_user(FOLLOW_UP_QUESTION)
+        executor.submit(
+            lambda request: answer_follow_up(request, conversation, FOLLOW_UP_QUESTION),
+            on_done=on_done, on_error=on_error, on_delta=on_delta
+        )
+
+    _, ttft, total = run_request(submit_follow_up)
+    metrics["follow_up_ui_ms"] = loop.take_max_duration() * 1000
+    metrics["follow_up_ttft_ms"] = ttft
+    metrics["follow_up_total_ms"] = total
+    return metrics
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, round(fraction * (len(ordered) - 1)))]
+
+def summarize(runs):
+    """{image: {metric: {"median": ..., "p95": ...}}}"""
+    summary = {}
+    for name, samples in runs.items():
+        summary[name] = {
+            metric: {
+                "median": percentile([sample[metric] for sample in samples], 0.5),
+                "p95": percentile([sample[metric] for sample in samples], 0.95),
+            }
+            for metric, _ in METRICS
+        }
+    return summary
+
+def print_report(summary, server, out):
+    for name, metrics in summary.items():
+        print(f"\n{name} capture", file=out)
+        for metric, label in METRICS:
+            values = metrics[metric]
+            print(f"  {label:<44} median {values['median']:9.1f}   p95 {values['p95']:9.1f}"
+                  f"  {metric.rsplit('_', 1)[1]}", file=out)
+    print(f"\nMock server: {server.stats.requests} requests, {server.stats.errors} injected errors",
+          file=out)
+
+def compare(summary, baseline, tolerance, out):
+    """Print medians that got worse than baseline by more than tolerance; True if none did"""
+    ok = True
+    for name, metrics in summary.items():
+        for metric, label in METRICS:
+            before = baseline.get(name, {}).get(metric, {}).get("median")
+            if before is None:
+                continue
+            after = metrics[metric]["median"]
+            # Ignore sub-millisecond noise on tiny numbers
+            if after > before * (1 + tolerance) and after - before > 1.0:
+                print(f"REGRESSION {name} {label}: {before:.1f} -> {after:.1f}", file=out)
+                ok = False
+    return ok
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="python -m study_helper_core.bench",
+        description="Measure the capture -> answer path against a local mock API"
+    )
+    parser.add_argument("paths", nargs="*", help="Images to use instead of the built-in samples")
+    parser.add_argument("--runs", type=int, default=5, help="Round trips per image")
+    parser.add_argument("--latency", type=float, default=0.2, help="Mock seconds before the first token")
+    parser.add_argument("--token-delay", type=float, default=0.002, help="Mock seconds between tokens")
+    parser.add_argument("--tokens", type=int, default=200, help="Mock words per reply")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Share of mock requests that fail")
+    parser.add_argument("--json", metavar="PATH", help="Save the summary as JSON")
+    parser.add_argument("--baseline", metavar="PATH", help="Summary JSON to check for regressions")
+    parser.add_argument("--tolerance", type=float, default=0.25,
+                        help="Allowed slowdown against the baseline (0.25 = 25%%)")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    server = MockServer(settings=MockSettings(
+        args.latency, args.token_delay, args.tokens, args.error_rate, seed=0
+    )).start()
+    config.set_overrides({
+        "api_base_url": server.base_url,
+        "api_key": "mock",
+        "api_warm_up": False,
+        "cache_enabled": False,  # Every run should reach the server
+        "api_retry_max_delay": 1.0,
+    })
+
+    if args.paths:
+        images = []
+        for path in find_images(args.paths):
+            with Image.open(path) as opened:
+                images.append((path.name, opened.convert("RGB")))
+    else:
+        images = sample_images()
+
+    out = sys.stdout
+    loop = UILoop()
+    executor = RequestExecutor(loop)
+    runs = {name: [] for name, _ in images}
+    try:
+        # The pipeline's own progress messages would drown out the report
+        with contextlib.redirect_stdout(io.StringIO()):
+            for name, image in images:
+                measure(loop, executor, name, image)  # Warm-up: connections, imports
+                for _ in range(args.runs):
+                    runs[name].append(measure(loop, executor, name, image))
+    finally:
+        executor.shutdown()
+        shutdown_ocr_pool()
+        server.stop()
+
+    summary = summarize(runs)
+    print_report(summary, server, out)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(summary, f, indent=4)
+    if args.baseline:
+        with open(args.baseline, "r") as f:
+            baseline = json.load(f)
+        if not compare(summary, baseline, args.tolerance, out):
+            return 1
+        print("No regressions against the baseline", file=out)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
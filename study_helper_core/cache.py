@@ -0,0 +1,225 @@
+"""Exact and near-duplicate lookup of earlier answers"""
+import os
+import json
+import hashlib
+import threading
+import time
+from pathlib import Path
+from collections import OrderedDict
+from PIL import Image, ImageChops, ImageStat
+
+from .config import config
+
+# Near-duplicate capture matching
+PHASH_MAX_SIZE_CHANGE = 0.1  # Captures must also be within 10% in width and height
+PHASH_INDEX_SIZE = 256  # Captures remembered per session
+PHASH_THUMBNAIL_SIZE = 64  # Grayscale thumbnail kept to confirm hash matches
+PHASH_MAX_PIXEL_DIFFERENCE = 4.0  # Mean absolute difference (0-255) of matching thumbnails
+PHASH_TEXT_THUMBNAIL_WIDTH = 512  # Text thumbnails keep enough detail to show one changed digit
+PHASH_TEXT_INK_LEVEL = 32  # Grey levels away from the background that count as text
+PHASH_TEXT_MAX_PIXEL_DIFFERENCE = 64  # Largest difference (0-255) of any pixel in matching text
+
+def image_digest(image):
+    """Hash the pixels of a PIL image (independent of how it was encoded)"""
+    digest = hashlib.sha256()
+    digest.update(f"{image.mode}:{image.size[0]}x{image.size[1]}:".encode("utf-8"))
+    digest.update(image.tobytes())
+    return digest.hexdigest()
+
+def make_cache_key(pixel_digest, model, prompts, max_tokens, settings=None):
+    """Combine an image hash with everything else that shapes the answer
+
+    settings holds anything else that decides how the capture is asked about,
+    such as OCR and model routing, so changing them doesn't serve old answers.
+    """
+    payload = json.dumps([pixel_digest, model, list(prompts), max_tokens, settings or {}],
+                         sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+def perceptual_hash(image):
+    """64-bit difference hash (dHash) of a downscaled grayscale copy"""
+    # Sample a coarse grid first - averaging every pixel of a 4K capture
+    # takes tens of milliseconds, this keeps it to a few
+    sampled = image.resize((9 * 32, 8 * 32), Image.NEAREST)
+    if sampled.mode not in ("RGB", "RGBA", "L"):
+        sampled = sampled.convert("RGB")
+    small = sampled.resize((9, 8), Image.BOX).convert("L").tobytes()
+
+    # Each bit records whether a pixel is brighter than its right neighbour
+    value = 0
+    for row in range(8):
+        pixels = small[row * 9:row * 9 + 9]
+        for col in range(8):
+            value = (value << 1) | (pixels[col] > pixels[col + 1])
+    return value
+
+def capture_thumbnail(image, text=False):
+    """Small grayscale copy used to confirm that two captures really look alike
+
+    Text snips get a larger copy cropped to the text itself, so re-snipping
+    the same question with a slightly different border still lines up.
+    Returns None for a text snip with no text in it.
+    """
+    if text:
+        return text_thumbnail(image)
+    sampled = image.resize((PHASH_THUMBNAIL_SIZE * 4,) * 2, Image.NEAREST)
+    return sampled.convert("L").resize((PHASH_THUMBNAIL_SIZE,) * 2, Image.BOX)
+
+def text_thumbnail(image):
+    gray = image.convert("L")
+    # The most common colour of a coarse sample is the background
+    histogram = gray.resize((128, 128), Image.NEAREST).histogram()
+    background = histogram.index(max(histogram))
+    ink = gray.point([
+        255 if abs(level - background) > PHASH_TEXT_INK_LEVEL else 0 for level in range(256)
+    ])
+    bbox = ink.getbbox()
+    if bbox is None:
+        return None
+    gray = gray.crop(bbox)
+    if gray.width > PHASH_TEXT_THUMBNAIL_WIDTH:
+        height = max(1, round(gray.height * PHASH_TEXT_THUMBNAIL_WIDTH / gray.width))
+        gray = gray.resize((PHASH_TEXT_THUMBNAIL_WIDTH, height), Image.BOX)
+    return gray
+
+def thumbnails_match(a, b, text=False):
+    """True if two thumbnails from capture_thumbnail show the same capture
+
+    Text snips of different questions share a layout and differ in only a
+    few pixels, so those must line up exactly and match almost pixel for pixel.
+    """
+    if a.size != b.size:
+        return False
+    difference = ImageChops.difference(a, b)
+    if text:
+        return difference.getextrema()[1] <= PHASH_TEXT_MAX_PIXEL_DIFFERENCE
+    return ImageStat.Stat(difference).mean[0] <= PHASH_MAX_PIXEL_DIFFERENCE
+
+def hamming_distance(a, b):
+    """Number of differing bits between two hashes"""
+    return bin(a ^ b).count("1")
+
+class PerceptualIndex:
+    """Small in-memory map from capture hashes to cache keys, searched by Hamming distance
+
+    A 64-bit hash mostly captures layout, so every hash match is confirmed
+    against a thumbnail of the earlier capture before its answer is reused.
+    """
+    def __init__(self, max_distance=None, max_entries=PHASH_INDEX_SIZE,
+                 max_size_change=PHASH_MAX_SIZE_CHANGE):
+        if max_distance is None:
+            max_distance = config.get("phash_max_distance")
+        self.max_distance = max_distance
+        self.max_entries = max_entries
+        self.max_size_change = max_size_change
+        # (hash, size) -> (cache key, thumbnail, text snip), oldest first
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def add(self, phash, size, cache_key, thumbnail, text=False):
+        """Remember which answer belongs to a capture"""
+        with self._lock:
+            self._entries[(phash, size)] = (cache_key, thumbnail, text)
+            self._entries.move_to_end((phash, size))
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def lookup(self, phash, size, thumbnail, text=False):
+        """Return the cache key of the closest similar capture, or None"""
+        candidates = []
+        with self._lock:
+            for (other_hash, other_size), entry in self._entries.items():
+                cache_key, other_thumbnail, other_text = entry
+                # Layout hashes can't tell apart captures of very different shape
+                if other_text != text or not self._similar_size(size, other_size):
+                    continue
+                distance = hamming_distance(phash, other_hash)
+                if distance <= self.max_distance:
+                    candidates.append((distance, cache_key, other_thumbnail))
+        candidates.sort(key=lambda candidate: candidate[0])
+        for _, cache_key, other_thumbnail in candidates:
+            if thumbnails_match(thumbnail, other_thumbnail, text):
+                return cache_key
+        return None
+
+    def _similar_size(self, size, other_size):
+        return all(
+            abs(a - b) <= self.max_size_change * max(a, b)
+            for a, b in zip(size, other_size)
+        )
+
+class ResponseCache:
+    """On-disk answer cache keyed by content hash, with LRU/size eviction and a TTL"""
+    def __init__(self, directory=None, max_entries=None, max_bytes=None, ttl=None):
+        self.directory = Path(directory or config.get("cache_dir"))
+        self.max_entries = max_entries or config.get("cache_max_entries")
+        self.max_bytes = max_bytes or config.get("cache_max_bytes")
+        self.ttl = ttl or config.get("cache_ttl_seconds")
+        self._lock = threading.Lock()
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+    def _path(self, key):
+        return self.directory / f"{key}.json"
+
+    def get(self, key):
+        """Return the cached answer for key, or None on a miss"""
+        path = self._path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                entry = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return None
+
+        if time.time() - entry.get("created", 0) > self.ttl:
+            self._remove(path)
+            return None
+
+        # Touch the file so eviction treats it as recently used
+        try:
+            os.utime(path, None)
+        except OSError:
+            pass
+        return entry.get("answer")
+
+    def put(self, key, answer, **metadata):
+        """Store an answer and evict old entries if the cache is over its limits"""
+        entry = dict(metadata, answer=answer, created=time.time())
+        path = self._path(key)
+        # Write to a temp file first so readers never see half an entry
+        temp_path = path.with_name(f"{key}.{threading.get_ident()}.tmp")
+        try:
+            with open(temp_path, "w", encoding="utf-8") as f:
+                json.dump(entry, f)
+            os.replace(temp_path, path)
+        except OSError as e:
+            print(f"Failed to write response cache entry: {e}")
+            self._remove(temp_path)
+            return
+        self._evict()
+
+    def _evict(self):
+        """Drop expired entries, then least recently used ones beyond the limits"""
+        with self._lock:
+            entries = []
+            for path in self.directory.glob("*.json"):
+                try:
+                    stat = path.stat()
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+
+            # Newest first; everything past the limits gets removed
+            entries.sort(key=lambda entry: entry[0], reverse=True)
+            now = time.time()
+            total_bytes = 0
+            for index, (last_used, size, path) in enumerate(entries):
+                total_bytes += size
+                if (index >= self.max_entries or total_bytes > self.max_bytes
+                        or now - last_used > self.ttl):
+                    self._remove(path)
+
+    def _remove(self, path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
@@ -0,0 +1,144 @@
+"""Command line front end: answer image files without opening a window"""
+import sys
+import glob
+import json
+import time
+import argparse
+import contextlib
+from pathlib import Path
+
+from .config import config, DEFAULT_CONFIG, parse_setting
+from .client import api_client
+from .ocr import shutdown_ocr_pool
+from .engine import Engine
+
+IMAGE_SUFFIXES = {".png", ".jpg", ".jpeg", ".bmp", ".gif", ".webp", ".tif", ".tiff"}
+
+def add_setting_arguments(parser):
+    """Flags shared by every entry point that override config.json settings"""
+    parser.add_argument("--model", help="Model for screenshots and hard questions")
+    parser.add_argument("--fast-model", help="Model for simple questions")
+    parser.add_argument("--no-routing", action="store_true", help="Send every request to --model")
+    parser.add_argument("--max-tokens", type=int, help="Maximum tokens per reply")
+    parser.add_argument("--detail", choices=["low", "high", "auto"], help="Image detail level")
+    parser.add_argument("--cache-dir", help="Directory for the response cache")
+    parser.add_argument("--no-cache", action="store_true", help="Disable the response cache")
+    parser.add_argument(
+        "--set",
+        action="append",
+        default=[],
+        metavar="KEY=VALUE",
+        help="Override any setting, e.g. --set ocr_enabled=false"
+    )
+
+def setting_overrides(parser, args):
+    """Settings dict for config.set_overrides from parsed add_setting_arguments flags"""
+    overrides = {}
+    for item in args.set:
+        key, _, value = item.partition("=")
+        if key not in DEFAULT_CONFIG:
+            parser.error(f"Unknown setting: {key}")
+        overrides[key] = parse_setting(key, value)
+    if args.model:
+        overrides["model"] = args.model
+    if args.max_tokens:
+        overrides["max_tokens"] = args.max_tokens
+    if args.fast_model:
+        overrides["fast_model"] = args.fast_model
+    if args.no_routing:
+        overrides["routing_enabled"] = False
+    if args.detail:
+        overrides["image_detail"] = args.detail
+    if args.cache_dir:
+        overrides["cache_dir"] = args.cache_dir
+    if args.no_cache:
+        overrides["cache_enabled"] = False
+    return overrides
+
+def find_images(paths):
+    """Image files named directly, matched by a glob or found in directories, in a stable order"""
+    for pattern in paths:
+        if any(char in pattern for char in "*?["):
+            matches = [Path(match) for match in sorted(glob.glob(pattern, recursive=True))]
+            yield from find_images([str(match) for match in matches if match.is_dir()
+                                    or match.suffix.lower() in IMAGE_SUFFIXES])
+            continue
+        path = Path(pattern)
+        if path.is_dir():
+            for child in sorted(path.rglob("*")):
+                if child.is_file() and child.suffix.lower() in IMAGE_SUFFIXES:
+                    yield child
+        else:
+            yield path
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="python -m study_helper_core",
+        description="Answer questions in image files without the overlay window"
+    )
+    parser.add_argument("paths", nargs="+", help="Image files, globs or directories of images")
+    parser.add_argument(
+        "--ask",
+        action="append",
+        default=[],
+        metavar="QUESTION",
+        help="Follow-up question to ask about every image (repeat for more)"
+    )
+    parser.add_argument("--json", action="store_true", help="Print one JSON object per image")
+    add_setting_arguments(parser)
+    args = parser.parse_args(argv)
+    return args, setting_overrides(parser, args)
+
+def main(argv=None):
+    args, overrides = parse_args(argv)
+    config.set_overrides(overrides)
+    if not api_client.api_key:
+        print("No API key: set api_key in config.json or STUDY_HELPER_API_KEY", file=sys.stderr)
+        return 2
+
+    # Answers go to stdout; the pipeline's progress messages go to stderr
+    out = sys.stdout
+    with contextlib.redirect_stdout(sys.stderr):
+        return run(args, out)
+
+def run(args, out):
+    engine = Engine()
+    # Stream answers to the terminal unless the output is meant for a program
+    on_delta = None if args.json else lambda text: print(text, end="", file=out, flush=True)
+    failures = 0
+    try:
+        for path in find_images(args.paths):
+            if not args.json:
+                print(f"==> {path}", file=out)
+            started = time.perf_counter()
+            try:
+                session = engine.analyze(path, on_delta=on_delta)
+                if session.from_cache and on_delta:
+                    on_delta(session.answer)  # Cached answers aren't streamed
+                follow_ups = []
+                for question in args.ask:
+                    if not args.json:
+                        print(f"\n\n--> {question}", file=out)
+                    follow_ups.append({
+                        "question": question,
+                        "answer": engine.follow_up(session, question, on_delta=on_delta)
+                    })
+            except Exception as e:
+                failures += 1
+                print(f"{path}: {e}", file=sys.stderr)
+                continue
+
+            if args.json:
+                print(json.dumps({
+                    "image": str(path),
+                    "answer": session.answer,
+                    "from_cache": session.from_cache,
+                    "model": session.route.model,
+                    "follow_ups": follow_ups,
+                    "seconds": round(time.perf_counter() - started, 3)
+                }), file=out, flush=True)
+            else:
+                print("\n", file=out)
+    finally:
+        shutdown_ocr_pool()
+    return 1 if failures else 0
@@ -0,0 +1,321 @@
+"""Shared OpenAI client and the streaming chat request helper"""
+import json
+import threading
+try:
+    from openai import OpenAI  # Updated import statement
+except ImportError:
+    import openai  # Fallback import
+
+from .config import config, get_api_key
+from .imaging import PreparedImage
+from .ratelimit import rate_limiter, estimate_request_tokens, call_with_retry, hedged_call
+from .tracing import span
+
+UPLOAD_CHUNK_SIZE = 64 * 1024  # Request body bytes handed to the socket at a time
+
+class APIStatusError(Exception):
+    """Error response to a request sent without the SDK"""
+    def __init__(self, message, status_code, headers=None):
+        super().__init__(f"Error code: {status_code} - {message}")
+        self.status_code = status_code
+        self.headers = headers or {}
+
+class RequestBody:
+    """JSON request body as a list of buffers, streamed to the socket in small pieces
+
+    Image data URLs are spliced in between the JSON around them instead of
+    being copied into one big string, so an upload never needs more than
+    the encoded image plus a chunk.
+    """
+    def __init__(self, chunks):
+        self.chunks = chunks
+
+    def __len__(self):
+        return sum(len(chunk) for chunk in self.chunks)
+
+    def __iter__(self):
+        for chunk in self.chunks:
+            with memoryview(chunk) as view:
+                for start in range(0, len(view), UPLOAD_CHUNK_SIZE):
+                    yield bytes(view[start:start + UPLOAD_CHUNK_SIZE])
+
+def has_images(messages):
+    """True if any message part still holds a PreparedImage"""
+    return any(
+        isinstance(part.get("image_url", {}).get("url"), PreparedImage)
+        for message in messages if isinstance(message["content"], list)
+        for part in message["content"]
+    )
+
+def request_body(**params):
+    """RequestBody for params, with PreparedImage URLs encoded in place"""
+    images = []
+
+    def placeholder(value):
+        if isinstance(value, PreparedImage):
+            images.append(value)
+            return f"@@image{len(images) - 1}@@"
+        raise TypeError(f"Can't send {type(value).__name__} in a request")
+
+    text = json.dumps(params, default=placeholder)
+    chunks = []
+    for index, image in enumerate(images):
+        head, text = text.split(f"@@image{index}@@", 1)
+        chunks.append(head.encode("utf-8"))
+        chunks.append(image.data_url_bytes())
+    chunks.append(text.encode("utf-8"))
+    return RequestBody(chunks)
+
+class APIClient:
+    """One long-lived OpenAI client whose connections are reused across requests"""
+    def __init__(self, api_key=None):
+        self.api_key = None
+        self._client = None  # openai>=1.0 client
+        self._session = None  # Shared requests session for the legacy SDK
+        self._http = None  # The openai>=1.0 client's httpx connection pool
+        if api_key:
+            self.set_api_key(api_key)
+
+    def set_api_key(self, api_key):
+        """Point the client at a (new) API key"""
+        self.api_key = api_key
+        # Keep-alive connections: one per concurrent request plus some slack
+        pool_size = config.get("max_concurrent_requests") + 2
+        try:
+            OpenAI
+        except NameError:
+            # Legacy SDK: share one pooled session instead of one per thread
+            openai.api_key = api_key
+            openai.api_base = config.get("api_base_url")
+            if self._session is None:
+                import requests
+                self._session = requests.Session()
+                self._session.mount("https://", requests.adapters.HTTPAdapter(
+                    pool_connections=1,
+                    pool_maxsize=pool_size
+                ))
+                openai.requestssession = self._session
+            return
+
+        import httpx
+        import importlib.util
+        old_client = self._client
+        self._http = httpx.Client(
+            # HTTP/2 multiplexes concurrent requests over one connection
+            http2=importlib.util.find_spec("h2") is not None,
+            limits=httpx.Limits(
+                max_connections=pool_size,
+                max_keepalive_connections=pool_size
+            ),
+            timeout=httpx.Timeout(
+                config.get("api_timeout"),
+                connect=config.get("api_connect_timeout")
+            )
+        )
+        self._client = OpenAI(
+            api_key=api_key,
+            base_url=config.get("api_base_url"),
+            http_client=self._http
+        )
+        if old_client is not None:
+            old_client.close()
+
+    def on_config_change(self, changed):
+        """Rebuild the connection when the key or connection settings change"""
+        settings = {"api_key", "api_base_url", "api_timeout", "api_connect_timeout",
+                    "max_concurrent_requests"}
+        if changed & settings and config.get("api_key"):
+            self.set_api_key(config.get("api_key"))
+
+    def _legacy_timeout(self):
+        return (config.get("api_connect_timeout"), config.get("api_timeout"))
+
+    def warm_up(self):
+        """Open a connection in the background so the first question skips TCP/TLS setup"""
+        def connect():
+            try:
+                # Listing models is free and goes through the same connection pool
+                if self._client is not None:
+                    self._client.models.list()
+                else:
+                    openai.Model.list(request_timeout=self._legacy_timeout())
+            except Exception as e:
+                print(f"Connection warm-up failed: {e}")
+
+        if self.api_key:
+            threading.Thread(target=connect, name="APIWarmUp", daemon=True).start()
+
+    def _post(self, body, stream):
+        """Send a prebuilt chat completion body on the shared connection pool
+
+        Returns (status, headers, lines, close) where lines iterates over the
+        response body as text lines.
+        """
+        url = config.get("api_base_url").rstrip("/") + "/chat/completions"
+        headers = {
+            "Authorization": f"Bearer {self.api_key}",
+            "Content-Type": "application/json",
+            "Content-Length": str(len(body)),
+        }
+        if self._http is not None:
+            response = self._http.send(
+                self._http.build_request("POST", url, headers=headers, content=iter(body)),
+                stream=True
+            )
+            return response.status_code, response.headers, response.iter_lines(), response.close
+
+        response = self._session.post(
+            url, headers=headers, data=body, stream=True, timeout=self._legacy_timeout()
+        )
+        lines = (line.decode("utf-8") for line in response.iter_lines())
+        return response.status_code, response.headers, lines, response.close
+
+    def _send_with_images(self, messages, model, max_tokens, stream):
+        """Yield reply text for messages holding PreparedImages, without the SDK copies"""
+        body = request_body(model=model, messages=messages, max_tokens=max_tokens, stream=stream)
+        status, headers, lines, close = self._post(body, stream)
+        try:
+            if status >= 400:
+                text = "\n".join(lines)
+                try:
+                    message = json.loads(text)["error"]["message"]
+                except (ValueError, KeyError, TypeError):
+                    message = text[:200]
+                raise APIStatusError(message, status, headers)
+            if not stream:
+                yield json.loads("\n".join(lines))["choices"][0]["message"]["content"]
+                return
+            for line in lines:
+                if not line.startswith("data:"):
+                    continue
+                data = line[5:].strip()
+                if data == "[DONE]":
+                    break
+                chunk = json.loads(data)
+                if chunk.get("choices"):
+                    delta = chunk["choices"][0].get("delta", {}).get("content")
+                    if delta:
+                        yield delta
+        finally:
+            close()
+
+    def create_chat_completion(self, messages, model=None, max_tokens=None):
+        """Run a chat completion and return the reply text (blocking)"""
+        model = model or config.get("model")
+        max_tokens = max_tokens or config.get("max_tokens")
+        if has_images(messages):
+            return "".join(self._send_with_images(messages, model, max_tokens, stream=False))
+        if self._client is not None:
+            response = self._client.chat.completions.create(
+                model=model,
+                messages=messages,
+                max_tokens=max_tokens
+            )
+            return response.choices[0].message.content
+
+        response = openai.ChatCompletion.create(
+            model=model,
+            messages=messages,
+            max_tokens=max_tokens,
+            request_timeout=self._legacy_timeout()
+        )
+        return response['choices'][0]['message']['content']
+
+    def stream_chat_completion(self, messages, model=None, max_tokens=None):
+        """Yield the reply text piece by piece as the model generates it"""
+        model = model or config.get("model")
+        max_tokens = max_tokens or config.get("max_tokens")
+        if has_images(messages):
+            yield from self._send_with_images(messages, model, max_tokens, stream=True)
+            return
+        if self._client is None:
+            stream = openai.ChatCompletion.create(
+                model=model,
+                messages=messages,
+                max_tokens=max_tokens,
+                stream=True,
+                request_timeout=self._legacy_timeout()
+            )
+            for chunk in stream:
+                if chunk['choices']:
+                    delta = chunk['choices'][0]['delta'].get('content')
+                    if delta:
+                        yield delta
+            return
+
+        stream = self._client.chat.completions.create(
+            model=model,
+            messages=messages,
+            max_tokens=max_tokens,
+            stream=True
+        )
+        try:
+            for chunk in stream:
+                if chunk.choices:
+                    delta = chunk.choices[0].delta.content
+                    if delta:
+                        yield delta
+        finally:
+            # Hand the connection back to the pool when the caller stops early
+            stream.close()
+
+api_client = APIClient(get_api_key())
+config.add_listener(api_client.on_config_change)
+
+def run_chat_request(request, messages, model=None, max_tokens=None):
+    """Complete messages inside a background job, streaming deltas through request.emit
+
+    Requests wait for the rate limiter, transient failures are retried with
+    backoff, and a slow first response is hedged with a second request.
+    Returns None if the request was cancelled before any reply arrived.
+    """
+    model = model or config.get("model")
+    max_tokens = max_tokens or config.get("max_tokens")
+    with span("api.request", "network", model=model):
+        return _run_chat_request(request, messages, model, max_tokens)
+
+def _run_chat_request(request, messages, model, max_tokens):
+    tokens = estimate_request_tokens(messages, max_tokens)
+
+    def send(start, discard=None, hedge=False):
+        # One limiter slot per attempt, taken before the hedge and deadline clocks start
+        if not rate_limiter.acquire(tokens, request):
+            return None
+        return hedged_call(request, start, discard, hedge_tokens=tokens if hedge else None)
+
+    if not config.get("stream_responses"):
+        # A whole answer can take longer than api_hedge_after, so never hedge it
+        return call_with_retry(
+            request, lambda: send(lambda: api_client.create_chat_completion(messages, model, max_tokens))
+        )
+
+    def open_stream():
+        # Only the first chunk is waited for here; the rest streams below
+        stream = api_client.stream_chat_completion(messages, model, max_tokens)
+        try:
+            first = next(stream, "")
+        except Exception:
+            stream.close()
+            raise
+        return stream, first
+
+    with span("api.first_token", "network", model=model):
+        opened = call_with_retry(
+            request,
+            lambda: send(open_stream, discard=lambda result: result[0].close(), hedge=True)
+        )
+    if opened is None:
+        return None
+    stream, first = opened
+    parts = [first]
+    if first:
+        request.emit(first)
+    try:
+        for delta in stream:
+            if request.cancelled:
+                break  # Closing the generator drops the connection
+            parts.append(delta)
+            request.emit(delta)
+    finally:
+        stream.close()
+    return "".join(parts)
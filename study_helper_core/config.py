@@ -0,0 +1,213 @@
+"""Settings: defaults, config.json, STUDY_HELPER_* environment variables and overrides"""
+import os
+import sys
+import json
+import threading
+import time
+from pathlib import Path
+from dotenv import load_dotenv
+
+# Per-user data lives outside the app folder so it survives rebuilds of the exe
+DATA_DIR = Path(os.environ.get("LOCALAPPDATA") or Path.home() / ".cache") / "StudyHelper"
+
+# Settings file, next to the program as before
+CONFIG_PATH = Path("config.json")
+CONFIG_ENV_PREFIX = "STUDY_HELPER_"  # e.g. STUDY_HELPER_MODEL=gpt-4o-mini
+CONFIG_CHECK_INTERVAL = 2.0  # Seconds between checks of config.json's mtime
+
+# Every tunable setting and its default. config.json, STUDY_HELPER_*
+# environment variables and command line flags override these in turn.
+DEFAULT_CONFIG = {
+    "api_key": None,
+
+    # Model and request
+    "model": "gpt-4o",
+    "max_tokens": 500,
+    "stream_responses": True,  # Show replies token by token as they are generated
+    "max_concurrent_requests": 2,  # Cap on API calls running at the same time
+    # Start on a capture before Get Help is clicked: "off", "prepare" (encode
+    # and OCR only) or "analyze" (also ask - costs a request per capture)
+    "prefetch_mode": "off",
+
+    # Model routing - "model" above handles screenshots and hard questions,
+    # simple ones go to the faster, cheaper model
+    "routing_enabled": True,
+    "fast_model": "gpt-4o-mini",
+    "fast_max_tokens": 400,
+    "route_fast_max_words": 20,  # Longer follow-ups go to the strong model
+    "route_fast_max_ocr_words": 120,  # Longer OCR'd questions go to the strong model
+    "route_strong_keywords": "prove,proof,derive,derivation,step by step,calculate,solve,compare,in detail,why does,why is",
+
+    # HTTP connection
+    "api_base_url": "https://api.openai.com/v1",
+    "api_timeout": 60,  # Seconds allowed for a whole request
+    "api_connect_timeout": 10,  # Seconds allowed to open a connection
+    "api_warm_up": True,  # Open the TLS connection at startup, before the first question
+
+    # Rate limits and retries - handy when many people share one API key
+    "rate_limit_requests_per_minute": 0,  # Client-side limits, 0 for none
+    "rate_limit_tokens_per_minute": 0,
+    "api_max_retries": 4,  # Retries for rate limits, timeouts and server errors
+    "api_retry_base_delay": 1.0,  # Seconds before the first retry, doubled each time
+    "api_retry_max_delay": 30.0,
+    "api_hedge_after": 8.0,  # Send a second copy of a request this slow to start, 0 to never
+
+    # Upload preparation
+    "image_detail": "high",
+    "image_photo_format": "JPEG",  # JPEG or WEBP for photo-like captures
+    "image_photo_quality": 85,
+    "image_grayscale_text": True,  # Drop colour from text-only snips
+
+    # Response cache
+    "cache_enabled": True,
+    "cache_dir": str(DATA_DIR / "response_cache"),
+    "cache_max_entries": 500,
+    "cache_max_bytes": 20 * 1024 * 1024,  # 20 MB of stored answers
+    "cache_ttl_seconds": 30 * 24 * 60 * 60,  # Answers expire after 30 days
+
+    # Near-duplicate capture matching
+    "phash_enabled": True,
+    "phash_max_distance": 4,  # Max differing bits (of 64) to count as the same capture
+
+    # Reusing answers to similar questions (OCR text and follow-ups) - needs NumPy
+    "semantic_enabled": True,
+    "semantic_min_similarity": 0.85,  # Cosine similarity (0-1) to count as the same question
+    "semantic_min_words": 6,  # Shorter questions depend too much on the conversation
+    "semantic_max_entries": 2000,  # Questions remembered, oldest dropped first
+    "semantic_refresh": False,  # Still ask for a fresh answer after showing a reused one
+
+    # Local OCR - text-only snips are sent as text instead of an image
+    "ocr_enabled": True,
+    "ocr_min_confidence": 80,  # Mean Tesseract word confidence (0-100) to trust the text
+    "ocr_workers": min(4, os.cpu_count() or 1),
+
+    # Conversation context sent with follow-up questions
+    "context_budget_tokens": 6000,  # Prompt size limit for follow-ups
+    "context_image_turns": 2,  # Follow-ups that still include the screenshot itself
+    "context_recent_messages": 6,  # Latest messages always sent word for word
+
+    # Performance tracing - spans go to trace.json (Chrome trace format) in trace_dir
+    "trace_enabled": False,
+    "trace_dir": str(DATA_DIR / "traces"),
+    "trace_max_bytes": 5 * 1024 * 1024,  # Rotate trace.json at 5 MB
+    "trace_max_files": 3,  # trace.json plus two older ones
+    "perf_hud": False,  # Show timings on screen at startup (F12 toggles it)
+
+    # Session history - every conversation is kept in a searchable SQLite file
+    "history_enabled": True,
+    "history_path": str(DATA_DIR / "history.db"),
+
+    # Screen capture - "builtin" drags a rectangle over the screen in-process,
+    # "snip" uses Windows Snip & Sketch and the clipboard
+    "capture_mode": "builtin",
+    "clipboard_timeout_ms": 60000,  # Give up waiting for a Snip & Sketch capture
+}
+
+# Load environment variables
+load_dotenv()
+
+def parse_setting(key, value):
+    """Convert a string from the environment or command line to the setting's type"""
+    default = DEFAULT_CONFIG.get(key)
+    if isinstance(default, bool):
+        return value.strip().lower() in ("1", "true", "yes", "on")
+    if isinstance(default, int):
+        return int(value)
+    if isinstance(default, float):
+        return float(value)
+    return value
+
+class Config:
+    """Settings loaded once from config.json and reloaded when the file changes
+
+    Later sources win: DEFAULT_CONFIG, config.json, STUDY_HELPER_* environment
+    variables, then overrides (command line flags).
+    """
+    def __init__(self, path=CONFIG_PATH, overrides=None):
+        self.path = Path(path)
+        self.overrides = dict(overrides or {})
+        self._values = dict(DEFAULT_CONFIG)
+        self._mtime = None
+        self._last_check = 0.0
+        self._listeners = []
+        self._lock = threading.RLock()
+        self.reload()
+
+    def get(self, key, default=None):
+        """Current value of a setting"""
+        self._check_for_changes()
+        return self._values.get(key, default)
+
+    def set_overrides(self, overrides):
+        """Apply command line overrides on top of everything else"""
+        self.overrides.update(overrides)
+        self.reload()
+
+    def add_listener(self, callback):
+        """Call callback(changed_keys) whenever settings change"""
+        self._listeners.append(callback)
+
+    def reload(self):
+        """Re-read config.json and the environment"""
+        with self._lock:
+            values = dict(DEFAULT_CONFIG)
+            try:
+                self._mtime = self.path.stat().st_mtime
+                with open(self.path, "r") as f:
+                    values.update(json.load(f))
+            except FileNotFoundError:
+                self._mtime = None
+            except (OSError, json.JSONDecodeError) as e:
+                print(f"Could not read {self.path}: {e}", file=sys.stderr)
+
+            for key in DEFAULT_CONFIG:
+                env_name = CONFIG_ENV_PREFIX + key.upper()
+                if env_name in os.environ:
+                    try:
+                        values[key] = parse_setting(key, os.environ[env_name])
+                    except ValueError:
+                        print(f"Ignoring invalid {env_name}={os.environ[env_name]!r}",
+                              file=sys.stderr)
+            values.update(self.overrides)
+
+            changed = {
+                key for key in set(values) | set(self._values)
+                if values.get(key) != self._values.get(key)
+            }
+            self._values = values
+
+        if changed:
+            for callback in self._listeners:
+                callback(changed)
+
+    def update_file(self, **settings):
+        """Write settings to config.json, keeping whatever else is in it"""
+        with self._lock:
+            try:
+                with open(self.path, "r") as f:
+                    stored = json.load(f)
+            except (FileNotFoundError, json.JSONDecodeError):
+                stored = {}
+            stored.update(settings)
+            with open(self.path, "w") as f:
+                json.dump(stored, f, indent=4)
+        self.reload()
+
+    def _check_for_changes(self):
+        # A stat() every couple of seconds at most, never a re-parse
+        now = time.monotonic()
+        if now - self._last_check < CONFIG_CHECK_INTERVAL:
+            return
+        self._last_check = now
+        try:
+            mtime = self.path.stat().st_mtime
+        except OSError:
+            mtime = None
+        if mtime != self._mtime:
+            self.reload()
+
+config = Config()
+
+# Configure OpenAI
+def get_api_key():
+    return config.get("api_key")
@@ -0,0 +1,136 @@
+"""Token counting and the trimmed history sent with follow-up questions"""
+import math
+
+from .config import config
+from .imaging import upload_size
+
+_token_encoding = None
+
+def count_tokens(text):
+    """Tokens in text - exact with tiktoken installed, otherwise ~4 characters each"""
+    global _token_encoding
+    if _token_encoding is None:
+        try:
+            import tiktoken
+            _token_encoding = tiktoken.get_encoding("o200k_base")
+        except Exception:
+            _token_encoding = False  # Don't try again
+    if _token_encoding:
+        return len(_token_encoding.encode(text))
+    return max(1, len(text) // 4)
+
+def estimate_image_tokens(size, detail=None):
+    """Tokens an image costs: 85 base plus 170 per 512px tile at high detail"""
+    if (detail or config.get("image_detail")) == "low":
+        return 85
+    width, height = upload_size(size, "high")
+    return 85 + 170 * math.ceil(width / 512) * math.ceil(height / 512)
+
+def shorten(text, limit):
+    """First sentences of text, at most limit characters"""
+    text = " ".join(text.split())
+    if len(text) <= limit:
+        return text
+    cut = text[:limit]
+    # Prefer ending on a sentence boundary
+    end = max(cut.rfind(". "), cut.rfind("? "), cut.rfind("! "))
+    if end > limit // 2:
+        return cut[:end + 1]
+    return cut.rstrip() + "..."
+
+class ConversationContext:
+    """Full chat history plus the trimmed version that is actually sent
+
+    Follow-ups are kept within a token budget: the screenshot is only resent
+    for the first few follow-ups, older turns are folded into a short local
+    summary, and if that isn't enough the longest parts are shortened.
+    """
+    IMAGE_PLACEHOLDER = ("[The screenshot was sent earlier and is no longer attached. "
+                         "Your first answer above describes what it showed.]")
+
+    def __init__(self, initial_messages, image_tokens=0):
+        self.history = list(initial_messages)
+        self.image_tokens = image_tokens  # Cost of the screenshot, if one is attached
+
+    def add_user(self, text):
+        self.history.append({"role": "user", "content": text})
+
+    def add_assistant(self, text):
+        self.history.append({"role": "assistant", "content": text})
+
+    def message_tokens(self, message):
+        """Approximate prompt tokens for one message"""
+        content = message["content"]
+        tokens = 4  # Per-message overhead
+        if isinstance(content, str):
+            return tokens + count_tokens(content)
+        for part in content:
+            if part["type"] == "text":
+                tokens += count_tokens(part["text"])
+            else:
+                tokens += self.image_tokens
+        return tokens
+
+    def total_tokens(self, messages):
+        return sum(self.message_tokens(message) for message in messages)
+
+    def build(self, budget=None):
+        """Messages for the next request, trimmed to the token budget"""
+        budget = budget or config.get("context_budget_tokens")
+        system, first_user = self.history[0], self.history[1]
+        first_answer = self.history[2] if len(self.history) > 2 else None
+        later = self.history[3:]
+
+        recent_count = config.get("context_recent_messages")
+        recent = later[-recent_count:] if recent_count else []
+        older = later[:len(later) - len(recent)]
+        follow_ups = sum(1 for message in later if message["role"] == "user")
+
+        keep_image = follow_ups <= config.get("context_image_turns")
+        summary_lines = self._summary_lines(older)
+        answer_shortened = False
+
+        def assemble():
+            messages = [system, self._first_user(first_user, keep_image)]
+            if first_answer is not None:
+                messages.append(first_answer)
+            if summary_lines:
+                messages.append({
+                    "role": "system",
+                    "content": "Summary of the earlier conversation:\n" + "\n".join(summary_lines)
+                })
+            return messages + recent
+
+        # Give things up in order of how little they're likely to matter
+        messages = assemble()
+        while self.total_tokens(messages) > budget:
+            if summary_lines:
+                summary_lines.pop(0)
+            elif keep_image and self.image_tokens:
+                keep_image = False
+            elif first_answer is not None and not answer_shortened and len(first_answer["content"]) > 600:
+                # Only once - shorten() may add "..." and land just over the limit
+                first_answer = {"role": "assistant", "content": shorten(first_answer["content"], 600)}
+                answer_shortened = True
+            elif len(recent) > 1:
+                recent = recent[1:]
+            else:
+                break  # Only the essentials are left
+            messages = assemble()
+        return messages
+
+    def _first_user(self, message, keep_image):
+        if keep_image or isinstance(message["content"], str):
+            return message
+        # Swap the image for a note so the model knows why it's gone
+        text = " ".join(part["text"] for part in message["content"] if part["type"] == "text")
+        return {"role": "user", "content": f"{text}\n\n{self.IMAGE_PLACEHOLDER}"}
+
+    def _summary_lines(self, messages):
+        lines = []
+        for message in messages:
+            if message["role"] == "user":
+                lines.append(f"- User asked: {shorten(message['content'], 200)}")
+            elif message["role"] == "assistant":
+                lines.append(f"- You answered: {shorten(message['content'], 300)}")
+        return lines
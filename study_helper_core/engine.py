@@ -0,0 +1,267 @@
+"""Capture analysis pipeline and a headless engine around it"""
+import threading
+from pathlib import Path
+from PIL import Image
+
+from .config import config
+from .imaging import classify_image, prepare_image
+from .ocr import extract_text, tesseract_path
+from .prompts import (ANALYSIS_SYSTEM_PROMPT, ANALYSIS_USER_PROMPT, OCR_SYSTEM_PROMPT,
+                      OCR_USER_PROMPT, build_image_messages, build_text_messages)
+from .context import ConversationContext, estimate_image_tokens
+from .router import model_router, run_routed_request
+from .tracing import span
+from .cache import (capture_thumbnail, image_digest, make_cache_key, perceptual_hash,
+                    PerceptualIndex, ResponseCache)
+from .semantic import create_semantic_index
+
+class CaptureAnalysis:
+    """Everything needed to answer one capture, worked out off the UI thread
+
+    Each step remembers its result, so a prefetch can prepare or fully answer
+    a capture and a later job picks up wherever it got to. Only one job may
+    use an instance at a time.
+    """
+    def __init__(self, screenshot, phash=None, cache=None, capture_index=None, semantic_index=None):
+        self.screenshot = screenshot
+        self.phash = phash
+        self.cache = cache
+        self.capture_index = capture_index
+        self.semantic_index = semantic_index
+        # Settings are read once so both steps agree
+        self.model = config.get("model")
+        self.max_tokens = config.get("max_tokens")
+        self.use_ocr = config.get("ocr_enabled") and tesseract_path
+        # The answer may come from the OCR prompt or the fast model, so those
+        # settings are part of the cache key too
+        self.key_settings = {"ocr": bool(self.use_ocr)}
+        if self.use_ocr:
+            self.key_settings["ocr_min_confidence"] = config.get("ocr_min_confidence")
+        if config.get("routing_enabled"):
+            self.key_settings["routing"] = [
+                config.get("fast_model"), config.get("fast_max_tokens"),
+                config.get("route_fast_max_ocr_words"), config.get("route_strong_keywords"),
+            ]
+
+        self.cache_key = None
+        self.cached_answer = None
+        self.thumbnail = None  # Set when near-duplicate matching applies to this capture
+        self.text_snip = False  # Whether the thumbnail is a text snip's
+        self.question = None  # OCR text, when the capture is sent as text
+        self.similar = None  # Match for an earlier question, if one was reused
+        self.conversation = None
+        self.route = None
+        self.answer = None
+
+    @property
+    def prepared(self):
+        return self.conversation is not None
+
+    def prepare(self, request):
+        """Look up the cache, encode the capture and run OCR"""
+        if self.prepared or request.cancelled:
+            return self
+        screenshot = self.screenshot
+
+        # Look for a stored answer before doing any encoding
+        if self.cache is not None:
+            with span("cache.lookup", "cache"):
+                self.cache_key = make_cache_key(
+                    image_digest(screenshot),
+                    self.model,
+                    (ANALYSIS_SYSTEM_PROMPT, ANALYSIS_USER_PROMPT, OCR_SYSTEM_PROMPT, OCR_USER_PROMPT),
+                    self.max_tokens,
+                    self.key_settings
+                )
+                self.cached_answer = self.cache.get(self.cache_key)
+
+            if self.phash is not None:
+                self.text_snip = classify_image(screenshot) == "text"
+                self.thumbnail = capture_thumbnail(screenshot, self.text_snip)
+                if self.text_snip and self.thumbnail is not None:
+                    # Hash the text itself, so the snip's border doesn't move the hash
+                    self.phash = perceptual_hash(self.thumbnail)
+            if self.cached_answer is not None and self.thumbnail is not None:
+                self.capture_index.add(
+                    self.phash, screenshot.size, self.cache_key, self.thumbnail, self.text_snip
+                )
+
+            # Fall back to a near-identical earlier capture
+            if self.cached_answer is None and self.thumbnail is not None:
+                similar_key = self.capture_index.lookup(
+                    self.phash, screenshot.size, self.thumbnail, self.text_snip
+                )
+                if similar_key is not None:
+                    self.cached_answer = self.cache.get(similar_key)
+
+        # Shrink and compress the capture before it goes over the network
+        prepared = prepare_image(screenshot)
+
+        # Plain text questions are much cheaper to send as text
+        initial_messages = None
+        if self.cached_answer is None and self.use_ocr and prepared.content == "text":
+            try:
+                with span("ocr.extract", "ocr"):
+                    ocr = extract_text(screenshot)
+            except Exception as e:
+                print(f"OCR failed, sending the image instead: {e}")
+            else:
+                if ocr.usable:
+                    initial_messages = build_text_messages(ocr.text)
+                    self.question = ocr.text
+                print(
+                    f"OCR: {ocr.word_count} words, {ocr.confidence:.0f}% confidence, "
+                    f"{ocr.text_coverage:.0%} text coverage -> "
+                    f"{'text prompt' if ocr.usable else 'image upload'}"
+                )
+        self.route = model_router.route_analysis(ocr.text if initial_messages is not None else None)
+        image_tokens = 0
+        if initial_messages is None:
+            initial_messages = build_image_messages(prepared)
+            image_tokens = estimate_image_tokens(prepared.size)
+        self.conversation = ConversationContext(initial_messages, image_tokens)
+
+        # The same question asked before, maybe worded or captured differently
+        if self.question is not None and self.semantic_index is not None:
+            self.similar = self.semantic_index.lookup(self.question)
+            if self.similar is not None:
+                self.cached_answer = self.similar.answer
+        return self
+
+    def run(self, request):
+        """Prepare if needed and answer; returns (conversation, answer, from_cache)"""
+        self.prepare(request)
+        if request.cancelled:
+            return None
+        # Follow-ups still need the image, so only the API call is skipped
+        if self.cached_answer is not None:
+            return self.conversation, self.cached_answer, True
+
+        if self.answer is None:
+            self.answer = self._ask(request)
+            if request.cancelled:
+                return None
+        return self.conversation, self.answer, False
+
+    def refresh(self, request):
+        """Ask for a new answer even though a stored one was found; returns it"""
+        self.prepare(request)
+        if request.cancelled:
+            return None
+        return self._ask(request)
+
+    def _ask(self, request):
+        # The conversation may have grown since, so only send how it started
+        answer = run_routed_request(request, self.conversation.history[:2], self.route)
+        if request.cancelled or not answer:
+            return answer
+        if self.cache is not None:
+            self.cache.put(self.cache_key, answer, model=self.route.model)
+            if self.thumbnail is not None:
+                self.capture_index.add(
+                    self.phash, self.screenshot.size, self.cache_key, self.thumbnail, self.text_snip
+                )
+        if self.question is not None and self.semantic_index is not None:
+            self.semantic_index.add(self.question, answer)
+        return answer
+
+def answer_follow_up(request, conversation, question, semantic_index=None):
+    """Answer the question just added to conversation; returns (answer, match)
+
+    A close enough earlier follow-up in a conversation that began the same way
+    is reused instead of calling the API, and shown as if it had streamed in.
+    """
+    first_answer = conversation.history[2]["content"]
+    match = None
+    if semantic_index is not None:
+        match = semantic_index.lookup(question, first_answer)
+    if match is not None:
+        if config.get("stream_responses"):
+            request.emit(match.answer)
+        return match.answer, match
+    route = model_router.route_follow_up(question)
+    answer = run_routed_request(request, conversation.build(), route)
+    if answer and not request.cancelled and semantic_index is not None:
+        semantic_index.add(question, answer, first_answer)
+    return answer, None
+
+class Request:
+    """Cancel flag and output sink for a job run on the calling thread"""
+    def __init__(self, on_delta=None):
+        self.on_delta = on_delta
+        self._cancel_event = threading.Event()
+
+    @property
+    def cancelled(self):
+        return self._cancel_event.is_set()
+
+    def cancel(self):
+        """Stop the job at its next check (safe to call from another thread)"""
+        self._cancel_event.set()
+
+    def sleep(self, seconds):
+        """Wait up to seconds; returns False if the request was cancelled meanwhile"""
+        return not self._cancel_event.wait(seconds)
+
+    def emit(self, text):
+        if self.on_delta:
+            self.on_delta(text)
+
+class Session:
+    """One analysed capture and the conversation that follows it"""
+    def __init__(self, analysis, answer, from_cache):
+        self.analysis = analysis
+        self.answer = answer  # First answer
+        self.from_cache = from_cache
+
+    @property
+    def conversation(self):
+        return self.analysis.conversation
+
+    @property
+    def route(self):
+        return self.analysis.route
+
+class Engine:
+    """Analyse captures and answer follow-ups without any UI
+
+    Calls block until the reply is complete; pass on_delta to receive it as
+    it streams. Separate threads can each run their own sessions.
+    """
+    def __init__(self, cache=None, capture_index=None, semantic_index=None):
+        if cache is None and config.get("cache_enabled"):
+            try:
+                cache = ResponseCache()
+            except OSError as e:
+                print(f"Response cache disabled: {e}")
+        if capture_index is None and config.get("phash_enabled"):
+            capture_index = PerceptualIndex()
+        if semantic_index is None:
+            semantic_index = create_semantic_index()
+        self.cache = cache
+        self.capture_index = capture_index
+        self.semantic_index = semantic_index
+
+    def analyze(self, image, on_delta=None, request=None):
+        """Answer a capture (a PIL image or a path to one); returns a Session"""
+        if isinstance(image, (str, Path)):
+            with Image.open(image) as opened:
+                image = opened.convert("RGB")
+        phash = perceptual_hash(image) if self.capture_index is not None else None
+        analysis = CaptureAnalysis(image, phash, self.cache, self.capture_index, self.semantic_index)
+        result = analysis.run(request or Request(on_delta))
+        if result is None:
+            return None  # Cancelled
+        conversation, answer, from_cache = result
+        conversation.add_assistant(answer)
+        return Session(analysis, answer, from_cache)
+
+    def follow_up(self, session, text, on_delta=None, request=None):
+        """Ask a follow-up question in session and return the reply"""
+        session.conversation.add_user(text)
+        answer, _ = answer_follow_up(
+            request or Request(on_delta), session.conversation, text, self.semantic_index
+        )
+        if answer is not None:
+            session.conversation.add_assistant(answer)
+        return answer
@@ -0,0 +1,138 @@
+"""Background workers whose results are handed back on a UI thread
+
+The widget only needs Tk's after(ms, callback), so anything with the same
+method (such as the benchmark's event loop) can drive it.
+"""
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from .config import config
+
+RESULT_POLL_MS = 16  # How often the UI thread checks for finished requests
+
+class BackgroundRequest:
+    """Handle for a job running on the RequestExecutor"""
+    def __init__(self, job, on_done=None, on_error=None, on_delta=None):
+        self.job = job
+        self.on_done = on_done
+        self.on_error = on_error
+        self.on_delta = on_delta
+        self.future = None
+        self._cancel_event = threading.Event()
+        self._output = []
+        self._output_lock = threading.Lock()
+
+    @property
+    def cancelled(self):
+        """True once cancel() was called - jobs should check this between steps"""
+        return self._cancel_event.is_set()
+
+    @property
+    def active(self):
+        """True while the request is queued or running and not cancelled"""
+        return not self.cancelled and self.future is not None and not self.future.done()
+
+    def cancel(self):
+        """Cancel the request; results that still arrive are discarded"""
+        self._cancel_event.set()
+        if self.future is not None:
+            self.future.cancel()  # Only succeeds if the job hasn't started yet
+
+    def sleep(self, seconds):
+        """Wait up to seconds; returns False if the request was cancelled meanwhile"""
+        return not self._cancel_event.wait(seconds)
+
+    def emit(self, text):
+        """Queue partial output from the worker; the UI picks it up once per frame"""
+        with self._output_lock:
+            self._output.append(text)
+
+    def take_output(self):
+        """Return and clear everything emitted since the last call"""
+        with self._output_lock:
+            text = "".join(self._output)
+            self._output.clear()
+        return text
+
+class RequestExecutor:
+    """Run blocking API calls on worker threads and hand results back to the Tk thread"""
+    def __init__(self, widget, max_workers=None):
+        self.widget = widget
+        max_workers = max_workers or config.get("max_concurrent_requests")
+        self._pool = ThreadPoolExecutor(
+            max_workers=max_workers,
+            thread_name_prefix="StudyHelperRequest"
+        )
+        self._finished = queue.Queue()
+        self._pending = set()
+        self._polling = False
+        self._closed = False
+
+    def submit(self, job, on_done=None, on_error=None, on_delta=None):
+        """Queue job(request) on a worker; callbacks run on the Tk thread via after()"""
+        if self._closed:
+            raise RuntimeError("Request executor has been shut down")
+        request = BackgroundRequest(job, on_done, on_error, on_delta)
+        request.future = self._pool.submit(self._run, request)
+        request.future.add_done_callback(lambda future: self._finished.put(request))
+        self._pending.add(request)
+        self._schedule_poll()
+        return request
+
+    def cancel_all(self):
+        """Cancel every queued and in-flight request"""
+        for request in list(self._pending):
+            request.cancel()
+
+    def shutdown(self):
+        """Cancel outstanding work and stop the worker threads without blocking"""
+        self._closed = True
+        self.cancel_all()
+        self._pool.shutdown(wait=False)
+
+    def _run(self, request):
+        # Skip jobs that were cancelled while waiting for a free worker
+        if request.cancelled:
+            return None
+        return request.job(request)
+
+    def _schedule_poll(self):
+        if not self._polling and not self._closed:
+            self._polling = True
+            self.widget.after(RESULT_POLL_MS, self._poll)
+
+    def _poll(self):
+        """Deliver finished requests on the Tk thread"""
+        self._polling = False
+        if self._closed:
+            return
+
+        # Coalesce everything streamed since the last tick into one update
+        for request in list(self._pending):
+            if request.on_delta and not request.cancelled:
+                text = request.take_output()
+                if text:
+                    request.on_delta(text)
+
+        while True:
+            try:
+                request = self._finished.get_nowait()
+            except queue.Empty:
+                break
+            self._pending.discard(request)
+            if request.cancelled or request.future.cancelled():
+                continue
+            # Flush output emitted after the delta pass above
+            text = request.take_output()
+            if text and request.on_delta:
+                request.on_delta(text)
+            error = request.future.exception()
+            if error is not None:
+                if request.on_error:
+                    request.on_error(error)
+            elif request.on_done:
+                request.on_done(request.future.result())
+        # Keep polling only while there is work in flight
+        if self._pending:
+            self._schedule_poll()
@@ -0,0 +1,312 @@
+"""Searchable on-disk history of past conversations"""
+import io
+import re
+import time
+import uuid
+import queue
+import sqlite3
+import threading
+from pathlib import Path
+from PIL import Image
+
+from .config import config
+from .context import ConversationContext, shorten
+from .tracing import span
+
+THUMBNAIL_SIZE = (240, 160)
+TITLE_LENGTH = 80
+SEARCH_LIMIT = 50
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    id TEXT PRIMARY KEY,
+    created REAL NOT NULL,
+    updated REAL NOT NULL,
+    title TEXT NOT NULL,
+    has_image INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS messages (
+    id INTEGER PRIMARY KEY,
+    session_id TEXT NOT NULL REFERENCES sessions(id) ON DELETE CASCADE,
+    role TEXT NOT NULL,
+    content TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS messages_session ON messages(session_id, id);
+-- Kept apart so listing sessions never reads image data
+CREATE TABLE IF NOT EXISTS thumbnails (
+    session_id TEXT PRIMARY KEY REFERENCES sessions(id) ON DELETE CASCADE,
+    data BLOB NOT NULL
+);
+CREATE INDEX IF NOT EXISTS sessions_updated ON sessions(updated);
+"""
+# Questions and answers only; rowid is messages.id
+FTS_SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5(
+    content, session_id UNINDEXED, tokenize='porter unicode61'
+);
+"""
+
+def message_text(message):
+    """Text of a chat message; attached images are left out"""
+    content = message["content"]
+    if isinstance(content, str):
+        return content
+    return "\n".join(part["text"] for part in content if part["type"] == "text")
+
+def has_image(message):
+    return not isinstance(message["content"], str) and any(
+        part["type"] != "text" for part in message["content"]
+    )
+
+def fts_query(text):
+    """FTS5 query matching every word of text, the last one as a prefix"""
+    words = re.findall(r"\w+", text)
+    if not words:
+        return None
+    terms = [f'"{word}"' for word in words]
+    terms[-1] += "*"  # Match while the last word is still being typed
+    return " ".join(terms)
+
+class SessionSummary:
+    """One row of a history listing or search"""
+    def __init__(self, id, title, created, updated, snippet=None):
+        self.id = id
+        self.title = title
+        self.created = created
+        self.updated = updated
+        self.snippet = snippet  # Matching text, for searches
+
+class HistoryStore:
+    """SQLite store of past sessions with a full-text index over their messages
+
+    Writes go through one background thread so saving never holds up the UI;
+    reads run on the caller's thread and see everything queued before them
+    once the writer catches up (WAL mode lets both run at the same time).
+    """
+    def __init__(self, path=None):
+        self.path = Path(path or config.get("history_path"))
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._read_lock = threading.Lock()
+        self._reader = self._connect()
+        self.fts = self._create_schema(self._reader)
+        self._writes = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="HistoryWriter", daemon=True)
+        self._thread.start()
+
+    def _connect(self):
+        connection = sqlite3.connect(self.path, check_same_thread=False, timeout=5)
+        connection.execute("PRAGMA journal_mode=WAL")
+        # A crash can lose the last write, but never corrupts the file
+        connection.execute("PRAGMA synchronous=NORMAL")
+        connection.execute("PRAGMA foreign_keys=ON")
+        return connection
+
+    def _create_schema(self, connection):
+        """Create the tables; returns whether full-text search is available"""
+        with connection:
+            connection.executescript(SCHEMA)
+            try:
+                connection.executescript(FTS_SCHEMA)
+                return True
+            except sqlite3.OperationalError as e:
+                # Some SQLite builds leave FTS5 out - searches fall back to LIKE
+                print(f"History search without a full-text index: {e}")
+                return False
+
+    # Writing
+
+    def create_session(self, screenshot, messages):
+        """Start a session from its first messages; returns the new session id"""
+        session_id = uuid.uuid4().hex
+        texts = [(message["role"], message_text(message)) for message in messages]
+        image = any(has_image(message) for message in messages)
+        answer = next((text for role, text in texts[1:] if role == "assistant"), "")
+        title = shorten(answer.split("\n", 1)[0], TITLE_LENGTH) or "Untitled"
+
+        def write(connection):
+            now = time.time()
+            connection.execute(
+                "INSERT INTO sessions (id, created, updated, title, has_image) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (session_id, now, now, title, image)
+            )
+            self._insert_messages(connection, session_id, texts)
+            if screenshot is not None:
+                connection.execute(
+                    "INSERT INTO thumbnails (session_id, data) VALUES (?, ?)",
+                    (session_id, self._encode_thumbnail(screenshot))
+                )
+        self._writes.put(write)
+        return session_id
+
+    def add_messages(self, session_id, messages):
+        """Append follow-up messages to a session"""
+        texts = [(message["role"], message_text(message)) for message in messages]
+
+        def write(connection):
+            self._insert_messages(connection, session_id, texts)
+            connection.execute(
+                "UPDATE sessions SET updated = ? WHERE id = ?", (time.time(), session_id)
+            )
+        self._writes.put(write)
+
+    def delete_session(self, session_id):
+        def write(connection):
+            if self.fts:
+                connection.execute("DELETE FROM messages_fts WHERE session_id = ?", (session_id,))
+            connection.execute("DELETE FROM sessions WHERE id = ?", (session_id,))
+        self._writes.put(write)
+
+    def _insert_messages(self, connection, session_id, texts):
+        for role, text in texts:
+            cursor = connection.execute(
+                "INSERT INTO messages (session_id, role, content) VALUES (?, ?, ?)",
+                (session_id, role, text)
+            )
+            if self.fts and role != "system":
+                connection.execute(
+                    "INSERT INTO messages_fts (rowid, content, session_id) VALUES (?, ?, ?)",
+                    (cursor.lastrowid, text, session_id)
+                )
+
+    def _encode_thumbnail(self, screenshot):
+        with span("history.thumbnail", "history"):
+            thumbnail = screenshot.copy()
+            thumbnail.thumbnail(THUMBNAIL_SIZE, Image.BILINEAR, reducing_gap=2.0)
+            if thumbnail.mode not in ("RGB", "L"):
+                thumbnail = thumbnail.convert("RGB")
+            buffer = io.BytesIO()
+            thumbnail.save(buffer, format="JPEG", quality=80)
+            return buffer.getvalue()
+
+    def _run(self):
+        connection = self._connect()
+        while True:
+            write = self._writes.get()
+            try:
+                if write is None:
+                    connection.close()
+                    return
+                with span("history.write", "history"), connection:
+                    write(connection)
+            except sqlite3.Error as e:
+                print(f"Failed to save history: {e}")
+            finally:
+                self._writes.task_done()
+
+    def flush(self):
+        """Wait until every queued write is on disk"""
+        self._writes.join()
+
+    def close(self):
+        """Finish queued writes and close the database"""
+        self._writes.put(None)
+        self._thread.join()
+        with self._read_lock:
+            self._reader.close()
+
+    # Reading
+
+    def _query(self, sql, params=()):
+        with self._read_lock:
+            return self._reader.execute(sql, params).fetchall()
+
+    def recent(self, limit=SEARCH_LIMIT):
+        """Latest sessions first"""
+        rows = self._query(
+            "SELECT id, title, created, updated FROM sessions ORDER BY updated DESC LIMIT ?",
+            (limit,)
+        )
+        return [SessionSummary(*row) for row in rows]
+
+    def search(self, text, limit=SEARCH_LIMIT):
+        """Sessions whose questions or answers match text, best matches first"""
+        query = fts_query(text)
+        if query is None:
+            return self.recent(limit)
+        with span("history.search", "history"):
+            if self.fts:
+                return self._search_index(query, limit)
+            return self._search_text(text.strip(), limit)
+
+    def _search_index(self, query, limit):
+        # Best-ranked messages first; keep the top one per session
+        matches = self._query(
+            "SELECT session_id, snippet(messages_fts, 0, '', '', '...', 12) "
+            "FROM messages_fts WHERE messages_fts MATCH ? ORDER BY rank LIMIT ?",
+            (query, limit * 4)
+        )
+        snippets = {}
+        for session_id, snippet in matches:
+            snippets.setdefault(session_id, snippet)
+        ids = list(snippets)[:limit]
+        rows = self._query(
+            "SELECT id, title, created, updated FROM sessions WHERE id IN (%s)"
+            % ",".join("?" * len(ids)),
+            ids
+        )
+        by_id = {row[0]: row for row in rows}
+        return [
+            SessionSummary(*by_id[session_id], snippets[session_id])
+            for session_id in ids if session_id in by_id
+        ]
+
+    def _search_text(self, text, limit):
+        # Much slower than the index, but fine for a personal history
+        pattern = "%" + text.replace("%", "").replace("_", "") + "%"
+        rows = self._query(
+            "SELECT s.id, s.title, s.created, s.updated, substr(m.content, 1, 120) "
+            "FROM sessions AS s JOIN messages AS m ON m.session_id = s.id "
+            "WHERE m.role != 'system' AND m.content LIKE ? "
+            "GROUP BY s.id ORDER BY s.updated DESC LIMIT ?",
+            (pattern, limit)
+        )
+        return [SessionSummary(*row) for row in rows]
+
+    def messages(self, session_id):
+        """All messages of a session, oldest first"""
+        rows = self._query(
+            "SELECT role, content FROM messages WHERE session_id = ? ORDER BY id",
+            (session_id,)
+        )
+        return [{"role": role, "content": content} for role, content in rows]
+
+    def exchanges(self):
+        """(question, answer, first_answer) for every user message and its reply, oldest first
+
+        first_answer is None for the question that opened a session.
+        """
+        rows = self._query("SELECT session_id, role, content FROM messages ORDER BY id")
+        previous = None
+        first_answers = {}
+        for session_id, role, content in rows:
+            if (role == "assistant" and previous is not None
+                    and previous[0] == session_id and previous[1] == "user"):
+                yield previous[2], content, first_answers.get(session_id)
+            if role == "assistant":
+                first_answers.setdefault(session_id, content)
+            previous = (session_id, role, content)
+
+    def thumbnail(self, session_id):
+        """The capture's thumbnail as a PIL image, or None"""
+        rows = self._query("SELECT data FROM thumbnails WHERE session_id = ?", (session_id,))
+        if not rows:
+            return None
+        image = Image.open(io.BytesIO(rows[0][0]))
+        image.load()
+        return image
+
+    def restore(self, session_id):
+        """ConversationContext to carry on a past session without asking again"""
+        messages = self.messages(session_id)
+        if len(messages) < 3:
+            return None
+        rows = self._query("SELECT has_image FROM sessions WHERE id = ?", (session_id,))
+        if rows and rows[0][0]:
+            # Only the text was kept; tell the model why the image is missing
+            first_user = messages[1]
+            messages[1] = {
+                "role": "user",
+                "content": f"{first_user['content']}\n\n{ConversationContext.IMAGE_PLACEHOLDER}"
+            }
+        return ConversationContext(messages)
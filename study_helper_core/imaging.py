@@ -0,0 +1,164 @@
+"""Shrinking and encoding captures before they are uploaded"""
+import binascii
+from PIL import Image, ImageChops, ImageStat
+
+from .config import config
+from .tracing import span
+
+# gpt-4o downsizes "high" detail images to fit 2048x2048 and then to 768px
+# on the short side, so anything larger is wasted upload
+IMAGE_MAX_LONG_SIDE = 2048
+IMAGE_MAX_SHORT_SIDE = 768
+
+ENCODE_SIZE_HINT = 8  # Encoded captures are rarely over 1/8 of the raw pixel data
+ENCODE_MAX_SLACK = 2  # Copy out results using less than half of their buffer
+BASE64_CHUNK = 3 * 16384  # Bytes encoded per call; a multiple of 3 so the pieces join cleanly
+
+class ByteSink:
+    """Write-only file object over one preallocated bytearray
+
+    Unlike BytesIO there is no getvalue() copy at the end: getbuffer() is a
+    view of the bytes that were written.
+    """
+    def __init__(self, size_hint):
+        self._buffer = bytearray(max(size_hint, 4096))
+        self._length = 0
+
+    def write(self, data):
+        end = self._length + len(data)
+        if end > len(self._buffer):
+            # Grow by half again (or as much as needed) to keep reallocations rare
+            self._buffer.extend(bytes(max(end - len(self._buffer), len(self._buffer) // 2)))
+        with memoryview(self._buffer) as view:
+            view[self._length:end] = data
+        self._length = end
+        return len(data)
+
+    def tell(self):
+        return self._length
+
+    def flush(self):
+        pass
+
+    def getbuffer(self):
+        """The written bytes, without copying"""
+        return memoryview(self._buffer)[:self._length]
+
+    def take(self):
+        """The written bytes to keep: a view, or one right-sized copy if most of
+        the buffer went unused (a view keeps the whole allocation alive)"""
+        if self._length * ENCODE_MAX_SLACK < len(self._buffer):
+            return bytes(self.getbuffer())
+        return self.getbuffer()
+
+class PreparedImage:
+    """Encoded screenshot ready to upload, plus what the preparation saved"""
+    def __init__(self, data, mime_type, size, original_size, content, original_bytes):
+        self.data = data  # Encoded image, a bytes-like view
+        self.mime_type = mime_type
+        self.size = size
+        self.original_size = original_size
+        self.content = content  # "text" or "photo"
+        self.original_bytes = original_bytes  # Uncompressed size of the source pixels
+        self._data_url = None
+
+    @property
+    def savings(self):
+        """Fraction of the uncompressed source size that isn't uploaded"""
+        if not self.original_bytes:
+            return 0.0
+        return 1 - len(self.data) / self.original_bytes
+
+    def data_url_bytes(self):
+        """Base64 data URL as ASCII bytes, encoded straight into one preallocated buffer
+
+        Built once and reused by every request that still attaches the image.
+        """
+        if self._data_url is None:
+            with span("image.base64", "encode", bytes=len(self.data)):
+                prefix = f"data:{self.mime_type};base64,".encode("ascii")
+                size = len(self.data)
+                url = bytearray(len(prefix) + 4 * ((size + 2) // 3))
+                url[:len(prefix)] = prefix
+                position = len(prefix)
+                with memoryview(url) as view:
+                    for start in range(0, size, BASE64_CHUNK):
+                        encoded = binascii.b2a_base64(self.data[start:start + BASE64_CHUNK], newline=False)
+                        view[position:position + len(encoded)] = encoded
+                        position += len(encoded)
+                self._data_url = url
+        return self._data_url
+
+    def data_url(self):
+        """Base64 data URL as a str (a copy - request bodies use data_url_bytes)"""
+        return self.data_url_bytes().decode("ascii")
+
+def upload_size(size, detail=None):
+    """Largest size the model will actually look at for this detail level"""
+    width, height = size
+    if (detail or config.get("image_detail")) == "low":
+        scale = min(1.0, 512 / max(width, height))
+    else:
+        scale = min(1.0, IMAGE_MAX_LONG_SIDE / max(width, height))
+        scale *= min(1.0, IMAGE_MAX_SHORT_SIDE / (min(width, height) * scale))
+    return max(1, round(width * scale)), max(1, round(height * scale))
+
+def classify_image(image):
+    """Guess whether a capture is text/UI ("text") or photographic ("photo")"""
+    # Nearest-neighbour sampling keeps the original colours intact
+    sample = image.resize((128, 128), Image.NEAREST).convert("RGB")
+    colors = sample.getcolors(128 * 128)
+    colors.sort(reverse=True)
+    # Text and UI snips are dominated by a handful of flat colours
+    flat_share = sum(count for count, _ in colors[:4]) / (128 * 128)
+    return "text" if flat_share >= 0.5 else "photo"
+
+def is_grayscale(image, tolerance=8):
+    """True if the image has (almost) no colour in it"""
+    sample = image.resize((128, 128), Image.NEAREST).convert("RGB")
+    red, green, blue = sample.split()
+    spread = ImageStat.Stat(ImageChops.difference(red, green)).mean[0]
+    spread += ImageStat.Stat(ImageChops.difference(green, blue)).mean[0]
+    return spread / 2 < tolerance
+
+def prepare_image(image, detail=None):
+    """Resize and compress a screenshot for upload"""
+    with span("image.prepare", "encode", size=list(image.size)):
+        original_size = image.size
+        original_bytes = image.size[0] * image.size[1] * len(image.getbands())
+        content = classify_image(image)
+
+        if image.mode not in ("RGB", "L"):
+            image = image.convert("RGB")
+
+        target_size = upload_size(image.size, detail)
+        if target_size != image.size:
+            with span("image.resize", "encode", size=list(target_size)):
+                image = image.resize(target_size, Image.LANCZOS, reducing_gap=3.0)
+
+        # Sized from what is actually encoded, not the full capture
+        upload_bytes = image.size[0] * image.size[1] * len(image.getbands())
+        buffer = ByteSink(upload_bytes // ENCODE_SIZE_HINT)
+        with span("image.encode", "encode", content=content):
+            if content == "text":
+                # Lossless keeps thin strokes readable; one channel is a third of the data
+                if config.get("image_grayscale_text") and image.mode != "L" and is_grayscale(image):
+                    image = image.convert("L")
+                image.save(buffer, format="PNG")
+                mime_type = "image/png"
+            elif config.get("image_photo_format").upper() == "WEBP":
+                image.save(buffer, format="WEBP", quality=config.get("image_photo_quality"), method=4)
+                mime_type = "image/webp"
+            else:
+                image.save(buffer, format="JPEG", quality=config.get("image_photo_quality"), optimize=True)
+                mime_type = "image/jpeg"
+
+        prepared = PreparedImage(
+            buffer.take(), mime_type, image.size, original_size, content, original_bytes
+        )
+    print(
+        f"Prepared {content} image: {original_size[0]}x{original_size[1]} -> "
+        f"{image.size[0]}x{image.size[1]} {mime_type}, {len(prepared.data) // 1024} KB "
+        f"({prepared.savings:.1%} smaller than the raw capture)"
+    )
+    return prepared
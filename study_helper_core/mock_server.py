@@ -0,0 +1,205 @@
+"""Local stand-in for the OpenAI chat completions API, for offline testing
+
+    python -m study_helper_core.mock_server --port 8089 --latency 0.5 --error-rate 0.1
+    python overlay_appv2.py --set api_base_url=http://127.0.0.1:8089/v1 --set api_key=sk-mock
+
+Speaks enough of the protocol for both SDK versions: GET /v1/models and
+POST /v1/chat/completions, streamed (server-sent events) or not. Latency,
+reply length and errors are configurable so retries and timeouts can be
+exercised too.
+"""
+import sys
+import json
+import time
+import random
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+class MockSettings:
+    """How the mock server behaves; can be changed while it runs"""
+    def __init__(self, latency=0.3, token_delay=0.01, tokens=150,
+                 error_rate=0.0, error_status=429, retry_after=1.0, seed=None):
+        self.latency = latency  # Seconds before the first token
+        self.token_delay = token_delay  # Seconds between streamed tokens
+        self.tokens = tokens  # Words in every reply
+        self.error_rate = error_rate  # Share of requests that fail
+        self.error_status = error_status
+        self.retry_after = retry_after  # Sent with 429 and 503 errors
+        self.random = random.Random(seed)
+
+class MockStats:
+    """What the server has seen, for benchmarks to report"""
+    def __init__(self):
+        self.requests = 0
+        self.errors = 0
+        self.request_bytes = []  # Body size of every chat completion request
+        self._lock = threading.Lock()
+
+    def record(self, size, failed):
+        with self._lock:
+            self.requests += 1
+            self.errors += failed
+            self.request_bytes.append(size)
+
+class MockOpenAIHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # Keep-alive, like the real API
+
+    def log_message(self, format, *args):
+        pass  # Quiet; benchmarks print their own results
+
+    def do_GET(self):
+        if self.path.rstrip("/").endswith("/models"):
+            self._send_json(200, {"object": "list", "data": [
+                {"id": "gpt-4o", "object": "model", "owned_by": "mock"},
+                {"id": "gpt-4o-mini", "object": "model", "owned_by": "mock"},
+            ]})
+        else:
+            self._send_error(404, "Not found", "invalid_request_error")
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length)
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self._send_error(404, "Not found", "invalid_request_error")
+            return
+        try:
+            request = json.loads(body)
+        except json.JSONDecodeError:
+            self._send_error(400, "Invalid JSON body", "invalid_request_error")
+            return
+
+        settings = self.server.settings
+        failed = settings.random.random() < settings.error_rate
+        self.server.stats.record(len(body), failed)
+        if failed:
+            self._send_error(settings.error_status, "Injected error", "rate_limit_error"
+                             if settings.error_status == 429 else "server_error")
+            return
+
+        time.sleep(settings.latency)
+        model = request.get("model", "gpt-4o")
+        tokens = min(settings.tokens, request.get("max_tokens") or settings.tokens)
+        words = [f"word{i}" for i in range(tokens)]
+        if request.get("stream"):
+            self._stream(model, words, settings.token_delay)
+        else:
+            time.sleep(settings.token_delay * len(words))
+            self._send_json(200, {
+                "id": "chatcmpl-mock",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": " ".join(words)},
+                    "finish_reason": "stop"
+                }],
+                "usage": {"prompt_tokens": len(body) // 4, "completion_tokens": len(words),
+                          "total_tokens": len(body) // 4 + len(words)}
+            })
+
+    def _stream(self, model, words, token_delay):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        def chunk(delta, finish_reason=None):
+            event = {
+                "id": "chatcmpl-mock",
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}]
+            }
+            self._write_chunk(f"data: {json.dumps(event)}\n\n")
+
+        try:
+            chunk({"role": "assistant", "content": ""})
+            for i, word in enumerate(words):
+                chunk({"content": word if i == 0 else " " + word})
+                time.sleep(token_delay)
+            chunk({}, "stop")
+            self._write_chunk("data: [DONE]\n\n")
+            self.wfile.write(b"0\r\n\r\n")
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # The client stopped reading (cancelled or hedged)
+
+    def _write_chunk(self, text):
+        data = text.encode("utf-8")
+        self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+        self.wfile.flush()
+
+    def _send_json(self, status, payload, headers=None):
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _send_error(self, status, message, error_type):
+        headers = {}
+        if status in (429, 503):
+            headers["Retry-After"] = f"{self.server.settings.retry_after:g}"
+        self._send_json(status, {"error": {"message": message, "type": error_type,
+                                           "param": None, "code": None}}, headers)
+
+class MockServer:
+    """Mock API running on a background thread"""
+    def __init__(self, host="127.0.0.1", port=0, settings=None):
+        self.settings = settings or MockSettings()
+        self.stats = MockStats()
+        self._server = ThreadingHTTPServer((host, port), MockOpenAIHandler)
+        self._server.daemon_threads = True
+        self._server.settings = self.settings
+        self._server.stats = self.stats
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start(self):
+        self._thread = threading.Thread(
+            target=self._server.serve_forever, name="MockOpenAI", daemon=True
+        )
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="python -m study_helper_core.mock_server",
+        description="Serve a fake OpenAI chat completions API"
+    )
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--latency", type=float, default=0.3, help="Seconds before the first token")
+    parser.add_argument("--token-delay", type=float, default=0.01, help="Seconds between tokens")
+    parser.add_argument("--tokens", type=int, default=150, help="Words per reply")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Share of requests that fail")
+    parser.add_argument("--error-status", type=int, default=429, help="HTTP status of injected errors")
+    parser.add_argument("--retry-after", type=float, default=1.0, help="Retry-After sent with 429/503")
+    args = parser.parse_args(argv)
+
+    settings = MockSettings(args.latency, args.token_delay, args.tokens,
+                            args.error_rate, args.error_status, args.retry_after)
+    server = MockServer(args.host, args.port, settings).start()
+    print(f"Mock OpenAI API at {server.base_url} (Ctrl+C to stop)")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        server.stop()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
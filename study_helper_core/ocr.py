@@ -0,0 +1,236 @@
+"""Local Tesseract OCR, split across processes for large captures"""
+import os
+import shutil
+import sys
+import threading
+import pytesseract
+from PIL import Image, ImageChops, ImageDraw
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+
+from .config import config
+
+# OCR heuristics
+OCR_MIN_WORDS = 5
+OCR_MIN_TEXT_COVERAGE = 0.6  # Share of the ink that must be words (less means a diagram)
+OCR_PARALLEL_MIN_PIXELS = 1500000  # Split captures bigger than this across processes
+
+# Configure Tesseract path
+def get_tesseract_path():
+    default_paths = [
+        r"C:\Program Files\Tesseract-OCR\tesseract.exe",
+        r"C:\Program Files (x86)\Tesseract-OCR\tesseract.exe",
+        r"C:\Users\loush\AppData\Local\Programs\Tesseract-OCR\tesseract.exe"
+    ]
+    
+    for path in default_paths:
+        if os.path.exists(path):
+            return path
+    # Linux/macOS installs are normally on PATH
+    return shutil.which("tesseract")
+
+tesseract_path = get_tesseract_path()
+if tesseract_path:
+    pytesseract.pytesseract.tesseract_cmd = tesseract_path
+else:
+    # Printed on import, so keep it off stdout where the CLI writes answers
+    print("Warning: Tesseract not found. OCR functionality may be limited.", file=sys.stderr)
+
+class OCRResult:
+    """Text read from a capture and how far it can be trusted"""
+    def __init__(self, text, confidence, word_count, text_coverage):
+        self.text = text
+        self.confidence = confidence  # Mean word confidence, 0-100
+        self.word_count = word_count
+        self.text_coverage = text_coverage  # Share of dark pixels inside word boxes
+
+    @property
+    def usable(self):
+        """True if the text can replace the image in the prompt"""
+        return (self.word_count >= OCR_MIN_WORDS
+                and self.confidence >= config.get("ocr_min_confidence")
+                and self.text_coverage >= OCR_MIN_TEXT_COVERAGE)
+
+def extract_text(image):
+    """Read the text of a capture with Tesseract"""
+    gray = image.convert("L")
+    # Tesseract works best around 30px text, so upscale small snips
+    scale = 2 if gray.height < 600 else 1
+    if scale != 1:
+        gray = gray.resize((gray.width * scale, gray.height * scale), Image.LANCZOS)
+
+    regions = []
+    workers = config.get("ocr_workers")
+    if workers > 1 and gray.width * gray.height >= OCR_PARALLEL_MIN_PIXELS:
+        regions = segment_regions(gray, workers)
+    if len(regions) > 1:
+        data = _ocr_regions_parallel(gray, regions)
+    else:
+        data = pytesseract.image_to_data(gray, output_type=pytesseract.Output.DICT)
+
+    # Rebuild lines and paragraphs from Tesseract's word list
+    lines = OrderedDict()
+    confidences = []
+    boxes = []
+    for i, word in enumerate(data["text"]):
+        word = word.strip()
+        confidence = float(data["conf"][i])
+        if not word or confidence < 0:
+            continue
+        key = (data["block_num"][i], data["par_num"][i], data["line_num"][i])
+        lines.setdefault(key, []).append(word)
+        confidences.append(confidence)
+        boxes.append((data["left"][i], data["top"][i], data["width"][i], data["height"][i]))
+
+    paragraphs = OrderedDict()
+    for (block, par, _), words in lines.items():
+        paragraphs.setdefault((block, par), []).append(" ".join(words))
+    text = "\n\n".join("\n".join(par_lines) for par_lines in paragraphs.values())
+
+    mean_confidence = sum(confidences) / len(confidences) if confidences else 0.0
+    return OCRResult(text, mean_confidence, len(confidences), text_coverage(gray, boxes))
+
+def _ink_mask(gray):
+    """255 where a pixel differs clearly from the background (most common) shade"""
+    histogram = gray.histogram()
+    background = histogram.index(max(histogram))
+    return gray.point(lambda v: 255 if abs(v - background) > 48 else 0)
+
+def _projection(ink, size):
+    """Ink profile along one axis; float mode so a single dot isn't rounded away"""
+    profile = ink.convert("F").resize(size, Image.BOX)
+    pixels = profile.load()
+    if size[1] == 1:
+        return [pixels[x, 0] for x in range(size[0])]
+    return [pixels[0, y] for y in range(size[1])]
+
+def _blank_runs(profile, min_length):
+    """(start, end) runs of empty entries in a projection profile"""
+    runs = []
+    start = None
+    for i, value in enumerate(profile + [255]):
+        if value == 0 and start is None:
+            start = i
+        elif value != 0 and start is not None:
+            if i - start >= min_length:
+                runs.append((start, i))
+            start = None
+    return runs
+
+def segment_regions(gray, max_regions):
+    """Split a page into (left, top, right, bottom) regions in reading order
+
+    Columns are separated by vertical gutters in the column ink profile,
+    then each column is cut at blank horizontal bands and the bands are
+    grouped so the regions have roughly equal heights.
+    """
+    ink = _ink_mask(gray)
+    width, height = gray.size
+
+    # Column profile: one pixel per column, non-zero where there's any ink
+    column_profile = _projection(ink, (width, 1))
+    gutters = [
+        run for run in _blank_runs(column_profile, max(20, width // 40))
+        if run[0] > 0 and run[1] < width  # Page margins aren't gutters
+    ]
+    edges = [0] + [(start + end) // 2 for start, end in gutters] + [width]
+    columns = list(zip(edges, edges[1:]))
+
+    regions = []
+    per_column = max(1, max_regions // len(columns))
+    for left, right in columns:
+        column = ink.crop((left, 0, right, height))
+        row_profile = _projection(column, (1, height))
+        bands = [
+            run for run in _blank_runs(row_profile, max(8, height // 100))
+            if run[0] > 0 and run[1] < height
+        ]
+        cuts = [(start + end) // 2 for start, end in bands]
+
+        # Pick the cut closest to each even split of the column height
+        chosen = []
+        for i in range(1, per_column):
+            target = height * i // per_column
+            if cuts:
+                best = min(cuts, key=lambda cut: abs(cut - target))
+                if best not in chosen:
+                    chosen.append(best)
+        bounds = [0] + sorted(chosen) + [height]
+        for top, bottom in zip(bounds, bounds[1:]):
+            regions.append((left, top, right, bottom))
+    return regions
+
+def _ocr_region(image, offset, tesseract_cmd):
+    """Process pool worker: OCR one region and shift its boxes back onto the page"""
+    if tesseract_cmd:
+        pytesseract.pytesseract.tesseract_cmd = tesseract_cmd
+    data = pytesseract.image_to_data(image, output_type=pytesseract.Output.DICT)
+    data["left"] = [left + offset[0] for left in data["left"]]
+    data["top"] = [top + offset[1] for top in data["top"]]
+    return data
+
+_ocr_pool = None
+_ocr_pool_lock = threading.Lock()  # Batch workers may OCR at the same time
+
+def get_ocr_pool():
+    """Shared process pool for OCR, started on first use"""
+    global _ocr_pool
+    with _ocr_pool_lock:
+        if _ocr_pool is None:
+            _ocr_pool = ProcessPoolExecutor(max_workers=config.get("ocr_workers"))
+        return _ocr_pool
+
+def shutdown_ocr_pool():
+    """Stop the OCR worker processes"""
+    global _ocr_pool
+    with _ocr_pool_lock:
+        if _ocr_pool is not None:
+            _ocr_pool.shutdown(wait=False)
+            _ocr_pool = None
+
+def _ocr_regions_parallel(gray, regions):
+    """OCR regions concurrently and merge the results in reading order"""
+    tesseract_cmd = pytesseract.pytesseract.tesseract_cmd
+    try:
+        pool = get_ocr_pool()
+        futures = [
+            pool.submit(_ocr_region, gray.crop(region), region[:2], tesseract_cmd)
+            for region in regions
+        ]
+        results = [future.result() for future in futures]
+    except Exception as e:
+        # A broken pool shouldn't cost us the OCR result
+        print(f"Parallel OCR failed, falling back to a single pass: {e}")
+        shutdown_ocr_pool()
+        return pytesseract.image_to_data(gray, output_type=pytesseract.Output.DICT)
+
+    merged = {}
+    for index, data in enumerate(results):
+        # Keep block numbers unique so regions never merge into one paragraph
+        data["block_num"] = [index * 10000 + block for block in data["block_num"]]
+        for key, values in data.items():
+            merged.setdefault(key, []).extend(values)
+    return merged
+
+def text_coverage(gray, boxes):
+    """Fraction of ink (pixels far from the background) that lies inside word boxes"""
+    # Work on a quarter-size copy; exact pixel counts don't matter here
+    factor = 4
+    small = gray.reduce(factor) if min(gray.size) >= factor * 8 else gray
+    factor = gray.width / small.width
+
+    ink = _ink_mask(small)
+
+    words = Image.new("L", small.size, 0)
+    draw = ImageDraw.Draw(words)
+    for left, top, width, height in boxes:
+        draw.rectangle(
+            (left / factor, top / factor, (left + width) / factor, (top + height) / factor),
+            fill=255
+        )
+
+    ink_pixels = ink.histogram()[255]
+    if not ink_pixels:
+        return 1.0
+    inked_words = ImageChops.multiply(ink, words).histogram()[255]
+    return inked_words / ink_pixels
@@ -0,0 +1,53 @@
+"""Prompts and the messages that start a conversation"""
+from .config import config
+
+# Prompts for the initial screenshot analysis
+ANALYSIS_SYSTEM_PROMPT = """You are a highly knowledgeable AI assistant. Analyze the image provided and:
+1. Identify the type of question or content
+2. Provide a clear, detailed explanation
+3. If it's a question, provide the answer or solution
+4. If relevant, explain the reasoning or methodology
+Be thorough but concise in your responses."""
+ANALYSIS_USER_PROMPT = "Please analyze this image and help me understand it."
+
+# Prompts used when the capture's text was read locally with OCR
+OCR_SYSTEM_PROMPT = """You are a highly knowledgeable AI assistant. The user captured part of their screen and its text was extracted with OCR, so it may contain small recognition errors. Analyze the text provided and:
+1. Identify the type of question or content
+2. Provide a clear, detailed explanation
+3. If it's a question, provide the answer or solution
+4. If relevant, explain the reasoning or methodology
+Be thorough but concise in your responses."""
+OCR_USER_PROMPT = "Please analyze this text from my screen and help me understand it:"
+
+def build_image_messages(prepared, detail=None):
+    """Initial conversation that sends the capture itself"""
+    return [
+        {
+            "role": "system",
+            "content": ANALYSIS_SYSTEM_PROMPT
+        },
+        {
+            "role": "user",
+            "content": [
+                {
+                    "type": "text",
+                    "text": ANALYSIS_USER_PROMPT
+                },
+                {
+                    "type": "image_url",
+                    "image_url": {
+                        # Spliced into the request body as base64 when it's sent
+                        "url": prepared,
+                        "detail": detail or config.get("image_detail")
+                    }
+                }
+            ]
+        }
+    ]
+
+def build_text_messages(text):
+    """Initial conversation that sends the capture's OCR text"""
+    return [
+        {"role": "system", "content": OCR_SYSTEM_PROMPT},
+        {"role": "user", "content": f"{OCR_USER_PROMPT}\n\n{text}"}
+    ]
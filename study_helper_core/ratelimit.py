@@ -0,0 +1,270 @@
+"""Rate limiting, retries with backoff and hedged requests for chat completions"""
+import time
+import queue
+import random
+import threading
+from email.utils import parsedate_to_datetime
+
+from .config import config
+from .context import count_tokens
+
+# Prompt tokens assumed for an image part (a 1024x768 capture at high detail)
+IMAGE_TOKEN_ESTIMATE = 765
+HEDGE_POLL_INTERVAL = 0.05  # Seconds between checks for cancellation while waiting
+
+# Errors worth trying again, by class name so both SDK versions are covered.
+# Matched against every base class, so subclasses such as httpx.ConnectError
+# or requests.ReadTimeout count too. Only the transport errors that can pass
+# on their own are listed: a bad URL, header or redirect loop fails the same
+# way every time, and the raw image upload path raises requests' errors
+TRANSIENT_ERROR_NAMES = {
+    "RateLimitError", "Timeout", "APITimeoutError", "APIConnectionError",
+    "ServiceUnavailableError", "InternalServerError", "TryAgain",
+    # httpx
+    "TimeoutException", "NetworkError", "RemoteProtocolError",
+    # requests
+    "ConnectionError", "ChunkedEncodingError",
+}
+TRANSIENT_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504}
+# SDK errors raised from a transport error; the wrapped error decides
+WRAPPER_ERROR_NAMES = {"APIConnectionError"}
+
+def error_status(error):
+    """HTTP status of an API error, if it has one"""
+    return getattr(error, "status_code", None) or getattr(error, "http_status", None)
+
+def is_transient_error(error):
+    """True for rate limits, timeouts and server hiccups that may work on a retry"""
+    if isinstance(error, (TimeoutError, ConnectionError)):
+        return True
+    if error_status(error) in TRANSIENT_STATUS_CODES:
+        return True
+    names = {cls.__name__ for cls in type(error).__mro__}
+    if error.__cause__ is not None and names & WRAPPER_ERROR_NAMES:
+        # Both SDKs raise APIConnectionError from a bad base URL too
+        return is_transient_error(error.__cause__)
+    return bool(names & TRANSIENT_ERROR_NAMES)
+
+def retry_after_seconds(error):
+    """Delay the server asked for in a Retry-After header, or None"""
+    headers = getattr(error, "headers", None)
+    if headers is None:
+        headers = getattr(getattr(error, "response", None), "headers", None)
+    if not headers:
+        return None
+    # OpenAI also sends the delay in milliseconds
+    value = headers.get("retry-after-ms")
+    if value is not None:
+        try:
+            return float(value) / 1000
+        except ValueError:
+            pass
+    value = headers.get("retry-after")
+    if value is None:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+def retry_delay(error, attempt):
+    """Seconds to wait before retry number attempt + 1"""
+    delay = retry_after_seconds(error)
+    if delay is not None:
+        return min(delay, config.get("api_retry_max_delay"))
+    # Exponential backoff with jitter so clients sharing a key don't retry in lockstep
+    delay = min(config.get("api_retry_max_delay"), config.get("api_retry_base_delay") * 2 ** attempt)
+    return delay / 2 + random.uniform(0, delay / 2)
+
+def estimate_request_tokens(messages, max_tokens):
+    """Tokens a request counts against the per-minute limit (prompt plus max reply)"""
+    tokens = max_tokens
+    for message in messages:
+        content = message["content"]
+        if isinstance(content, str):
+            tokens += count_tokens(content)
+            continue
+        for part in content:
+            if part["type"] == "text":
+                tokens += count_tokens(part["text"])
+            else:
+                tokens += IMAGE_TOKEN_ESTIMATE
+    return tokens
+
+class TokenBucket:
+    """Refills at per_minute / 60 per second up to one minute's worth
+
+    Takes go into debt rather than failing, so callers are served in the
+    order they asked and only need to wait for the debt to be paid off.
+    """
+    def __init__(self, per_minute):
+        self.per_minute = per_minute
+        self.rate = per_minute / 60.0
+        self.level = float(per_minute)
+        self.updated = time.monotonic()
+
+    def take(self, amount):
+        """Remove amount and return the seconds until the bucket is out of debt"""
+        now = time.monotonic()
+        self.level = min(self.per_minute, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+        # A single request larger than the bucket still has to get through
+        self.level -= min(amount, self.per_minute)
+        return max(0.0, -self.level / self.rate)
+
+    def available(self, amount):
+        """True if amount could be taken right now without going into debt"""
+        now = time.monotonic()
+        level = min(self.per_minute, self.level + (now - self.updated) * self.rate)
+        return level >= min(amount, self.per_minute)
+
+class RateLimiter:
+    """Client-side requests and tokens per minute limits, shared by every worker
+
+    A 429 from the server pauses everyone for the Retry-After delay instead
+    of letting other workers walk into the same limit.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._limits = None
+        self._requests = None
+        self._tokens = None
+        self._paused_until = 0.0
+
+    def _buckets(self):
+        limits = (config.get("rate_limit_requests_per_minute"),
+                  config.get("rate_limit_tokens_per_minute"))
+        if limits != self._limits:
+            # Settings changed - start over with full buckets
+            self._limits = limits
+            self._requests = TokenBucket(limits[0]) if limits[0] else None
+            self._tokens = TokenBucket(limits[1]) if limits[1] else None
+        return self._requests, self._tokens
+
+    def acquire(self, tokens, request):
+        """Wait for room to send a request; returns False if it was cancelled meanwhile"""
+        with self._lock:
+            requests_bucket, tokens_bucket = self._buckets()
+            wait = self._paused_until - time.monotonic()
+            if requests_bucket is not None:
+                wait = max(wait, requests_bucket.take(1))
+            if tokens_bucket is not None:
+                wait = max(wait, tokens_bucket.take(tokens))
+        if wait > 0:
+            return request.sleep(wait)
+        return not request.cancelled
+
+    def try_acquire(self, tokens):
+        """Take room for a request only if there is some right now; never waits"""
+        with self._lock:
+            requests_bucket, tokens_bucket = self._buckets()
+            if self._paused_until > time.monotonic():
+                return False
+            if requests_bucket is not None and not requests_bucket.available(1):
+                return False
+            if tokens_bucket is not None and not tokens_bucket.available(tokens):
+                return False
+            if requests_bucket is not None:
+                requests_bucket.take(1)
+            if tokens_bucket is not None:
+                tokens_bucket.take(tokens)
+            return True
+
+    def pause(self, seconds):
+        """Hold back every request for seconds"""
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+rate_limiter = RateLimiter()
+
+def call_with_retry(request, call):
+    """call(), retried with backoff on transient errors; None if cancelled while waiting"""
+    attempt = 0
+    while True:
+        try:
+            return call()
+        except Exception as e:
+            if attempt >= config.get("api_max_retries") or not is_transient_error(e) or request.cancelled:
+                raise
+            delay = retry_delay(e, attempt)
+            if error_status(e) == 429:
+                rate_limiter.pause(delay)
+            print(f"Request failed ({e}), retry {attempt + 1} in {delay:.1f}s")
+            if not request.sleep(delay):
+                return None
+            attempt += 1
+
+def hedged_call(request, start, discard=None, hedge_tokens=None):
+    """Run start() with a deadline, hedging with a second call if it is slow
+
+    Only hedges when hedge_tokens (the request's estimated tokens) is given:
+    if start() hasn't returned after api_hedge_after seconds and the rate
+    limiter has room right now, a second copy is started and whichever
+    finishes first wins; discard(result) is called on the loser's result.
+    Rate limiting for the first call must happen before this is called, so
+    waiting for it doesn't count towards the hedge or the deadline.
+    Gives up with TimeoutError after api_timeout seconds. Returns None if the
+    request is cancelled while waiting.
+    """
+    hedge_after = config.get("api_hedge_after")
+    deadline = time.monotonic() + config.get("api_timeout")
+    results = queue.Queue()
+    state = {"decided": False}
+    lock = threading.Lock()
+
+    def attempt():
+        try:
+            result = start()
+        except Exception as e:
+            results.put((False, e))
+            return
+        with lock:
+            lost = state["decided"]
+            state["decided"] = True
+        if not lost:
+            results.put((True, result))
+        elif discard is not None and result is not None:
+            discard(result)
+
+    def launch():
+        threading.Thread(target=attempt, name="StudyHelperAttempt", daemon=True).start()
+
+    def give_up():
+        with lock:
+            state["decided"] = True  # Late results get discarded
+
+    launch()
+    started = time.monotonic()
+    attempts = 1
+    failures = 0
+    while True:
+        try:
+            ok, value = results.get(timeout=HEDGE_POLL_INTERVAL)
+        except queue.Empty:
+            now = time.monotonic()
+            if request.cancelled:
+                give_up()
+                return None
+            if now >= deadline:
+                give_up()
+                raise TimeoutError(f"No response within {config.get('api_timeout')}s")
+            if (hedge_tokens is not None and hedge_after and attempts == 1
+                    and now - started >= hedge_after):
+                # Never wait for the limiter (or go over it) just to hedge
+                if rate_limiter.try_acquire(hedge_tokens):
+                    print(f"No response after {hedge_after}s, sending a second request")
+                    launch()
+                    attempts += 1
+                else:
+                    hedge_after = None
+            continue
+        if ok:
+            return value
+        failures += 1
+        if failures == attempts:
+            give_up()
+            raise value
@@ -0,0 +1,103 @@
+"""Choosing between the fast and strong model, with per-route latency stats"""
+import re
+import time
+import threading
+from collections import deque
+
+from .config import config
+from .client import run_chat_request
+
+class Route:
+    """Model and reply length picked for one request"""
+    def __init__(self, name, model, max_tokens, reason):
+        self.name = name  # "fast" or "strong"
+        self.model = model
+        self.max_tokens = max_tokens
+        self.reason = reason
+
+    def __repr__(self):
+        return f"Route({self.name}, {self.model}, {self.reason})"
+
+# Equations, operators between numbers and math symbols
+MATH_PATTERN = re.compile(r"\d\s*[-+*/^=<>]\s*\d|[=\u221a\u222b\u2211\u03c0\u2264\u2265]|\b(?:sin|cos|tan|log|ln|lim)\b")
+
+class ModelRouter:
+    """Sends each request to the fast or strong model and tracks their latency
+
+    Screenshots always go to the strong model. Text (OCR'd questions and
+    follow-ups) goes to the fast model unless it's long, mentions one of
+    route_strong_keywords or contains math.
+    """
+    STATS_WINDOW = 50  # Latencies kept per route
+
+    def __init__(self):
+        self._latencies = {}
+        self._lock = threading.Lock()
+
+    def strong(self, reason):
+        return Route("strong", config.get("model"), config.get("max_tokens"), reason)
+
+    def fast(self, reason):
+        return Route("fast", config.get("fast_model"), config.get("fast_max_tokens"), reason)
+
+    def route_analysis(self, ocr_text=None):
+        """Route for the first look at a capture; ocr_text is None when sending the image"""
+        if not config.get("routing_enabled"):
+            return self.strong("routing disabled")
+        if ocr_text is None:
+            return self.strong("image")
+        return self._route_text(ocr_text, config.get("route_fast_max_ocr_words"))
+
+    def route_follow_up(self, text):
+        """Route for a question typed into the chat"""
+        if not config.get("routing_enabled"):
+            return self.strong("routing disabled")
+        return self._route_text(text, config.get("route_fast_max_words"))
+
+    def _route_text(self, text, max_words):
+        words = len(text.split())
+        if words > max_words:
+            return self.strong(f"{words} words")
+        lowered = text.lower()
+        for keyword in self._strong_keywords():
+            if keyword in lowered:
+                return self.strong(f"keyword '{keyword}'")
+        if MATH_PATTERN.search(text):
+            return self.strong("math")
+        return self.fast(f"{words} words")
+
+    def _strong_keywords(self):
+        keywords = config.get("route_strong_keywords") or []
+        if isinstance(keywords, str):
+            keywords = keywords.split(",")
+        return [keyword.strip().lower() for keyword in keywords if keyword.strip()]
+
+    def record(self, route, seconds):
+        """Note how long a request on route took (safe to call from workers)"""
+        with self._lock:
+            latencies = self._latencies.setdefault(route.name, deque(maxlen=self.STATS_WINDOW))
+            latencies.append(seconds)
+        print(f"Route {route.name} ({route.model}, {route.reason}): {seconds:.2f}s - {self.summary(route.name)}")
+
+    def stats(self):
+        """{route: (requests, mean seconds, median seconds)} over the recent window"""
+        with self._lock:
+            snapshot = {name: sorted(values) for name, values in self._latencies.items()}
+        return {
+            name: (len(values), sum(values) / len(values), values[len(values) // 2])
+            for name, values in snapshot.items() if values
+        }
+
+    def summary(self, name):
+        count, mean, median = self.stats().get(name, (0, 0.0, 0.0))
+        return f"avg {mean:.2f}s, median {median:.2f}s over {count} requests"
+
+model_router = ModelRouter()
+
+def run_routed_request(request, messages, route):
+    """run_chat_request on route's model, recording its latency"""
+    started = time.perf_counter()
+    reply = run_chat_request(request, messages, route.model, route.max_tokens)
+    if not request.cancelled:
+        model_router.record(route, time.perf_counter() - started)
+    return reply
@@ -0,0 +1,174 @@
+"""Finding earlier answers to similar questions with hashed TF-IDF vectors"""
+import re
+import zlib
+import threading
+
+try:
+    import numpy as np
+except ImportError:
+    np = None  # Only exact and near-duplicate capture matches without it
+
+from .config import config
+from .prompts import ANALYSIS_USER_PROMPT, OCR_USER_PROMPT
+from .tracing import span
+
+SEMANTIC_DIMENSIONS = 2 ** 12  # Hashed feature buckets per question
+SEMANTIC_INITIAL_ROWS = 64
+SEMANTIC_CANDIDATES = 5  # Closest questions checked for matching numbers and variables
+WORD_PATTERN = re.compile(r"\w+")
+
+def question_words(text):
+    return WORD_PATTERN.findall(text.lower())
+
+def question_terms(words):
+    """Numbers and variable names - problems that differ in these need their own answer"""
+    return frozenset(
+        word for word in words
+        if any(char.isdigit() for char in word) or (len(word) == 1 and word not in "ai")
+    )
+
+def context_key(first_answer):
+    """Follow-ups are only reused within conversations that began with the same answer"""
+    if first_answer is None:
+        return None
+    return zlib.crc32(first_answer.encode("utf-8"))
+
+def match_key(terms, context):
+    """Number shared by every question with these terms and context, for filtering rows"""
+    return hash((terms, context))
+
+def question_text(content):
+    """The question in a user message, or None if it's only the image prompt"""
+    if content.startswith(OCR_USER_PROMPT):
+        return content[len(OCR_USER_PROMPT):].strip()
+    if content == ANALYSIS_USER_PROMPT:
+        return None
+    return content
+
+class Match:
+    """An earlier question close enough to reuse its answer"""
+    def __init__(self, question, answer, similarity):
+        self.question = question
+        self.answer = answer
+        self.similarity = similarity
+
+class SemanticIndex:
+    """Nearest-neighbour search over past questions, kept in one NumPy matrix
+
+    Each question becomes a vector of log-scaled counts of its words and word
+    pairs, hashed into a fixed number of buckets. Inverse document frequency
+    weights are applied at search time, so common words like "what" or
+    "solve" count for little. Follow-ups such as "explain step 2" mean
+    something different in every conversation, so they are stored with the
+    conversation's first answer and only match within it. Safe to use from
+    several threads.
+    """
+    def __init__(self, max_entries=None, dimensions=SEMANTIC_DIMENSIONS):
+        self.max_entries = max_entries or config.get("semantic_max_entries")
+        self.dimensions = dimensions
+        self._counts = np.zeros((SEMANTIC_INITIAL_ROWS, dimensions), dtype=np.float32)
+        self._document_frequency = np.zeros(dimensions, dtype=np.float32)
+        self._entries = []  # (question, answer, terms, context) per matrix row
+        self._match_keys = np.zeros(SEMANTIC_INITIAL_ROWS, dtype=np.int64)  # match_key per row
+        self._next_row = 0  # Oldest row once the index is full
+        self._weighted = None  # Normalised TF-IDF rows, rebuilt after changes
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def usable(self, question):
+        return len(question_words(question)) >= config.get("semantic_min_words")
+
+    def _vector(self, words):
+        features = words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+        buckets = [zlib.crc32(feature.encode("utf-8")) % self.dimensions for feature in features]
+        counts = np.bincount(buckets, minlength=self.dimensions).astype(np.float32)
+        return np.log1p(counts)
+
+    def add(self, question, answer, first_answer=None):
+        """Remember the answer to a question (a follow-up if first_answer is given)"""
+        if not answer or not self.usable(question):
+            return
+        words = question_words(question)
+        vector = self._vector(words)
+        terms = question_terms(words)
+        context = context_key(first_answer)
+        entry = (question, answer, terms, context)
+        with self._lock:
+            if len(self._entries) < self.max_entries:
+                row = len(self._entries)
+                if row == len(self._counts):
+                    grown = np.zeros(
+                        (min(self.max_entries, 2 * row), self.dimensions), dtype=np.float32
+                    )
+                    grown[:row] = self._counts
+                    self._counts = grown
+                    grown_keys = np.zeros(len(grown), dtype=np.int64)
+                    grown_keys[:row] = self._match_keys
+                    self._match_keys = grown_keys
+                self._entries.append(entry)
+            else:
+                # Full - overwrite the oldest question
+                row = self._next_row
+                self._next_row = (row + 1) % self.max_entries
+                self._document_frequency -= self._counts[row] > 0
+                self._entries[row] = entry
+            self._counts[row] = vector
+            self._match_keys[row] = match_key(terms, context)
+            self._document_frequency += vector > 0
+            self._weighted = None
+
+    def add_history(self, store):
+        """Fill the index from a HistoryStore's saved sessions"""
+        with span("semantic.load", "cache"):
+            for question, answer, first_answer in store.exchanges():
+                if first_answer is None:
+                    question = question_text(question)
+                if question is not None:
+                    self.add(question, answer, first_answer)
+
+    def lookup(self, question, first_answer=None):
+        """Closest earlier question if it's similar enough, else None"""
+        if not self._entries or not self.usable(question):
+            return None
+        with span("semantic.lookup", "cache"), self._lock:
+            count = len(self._entries)
+            idf = np.log((1 + count) / (1 + self._document_frequency)) + 1
+            if self._weighted is None:
+                weighted = self._counts[:count] * idf
+                norms = np.linalg.norm(weighted, axis=1, keepdims=True)
+                self._weighted = weighted / np.maximum(norms, 1e-9)
+            words = question_words(question)
+            query = self._vector(words) * idf
+            norm = np.linalg.norm(query)
+            if norm == 0:
+                return None
+            similarities = self._weighted @ (query / norm)
+
+            # Wording can differ a little, the numbers can't: "2x + 3 = 11"
+            # and "2x + 5 = 11" read almost the same but need different answers.
+            # Rows from other conversations or with other numbers are ruled out
+            # before the closest are picked, so they can't crowd out a match
+            terms = question_terms(words)
+            context = context_key(first_answer)
+            similarities[self._match_keys[:count] != match_key(terms, context)] = -1
+            min_similarity = config.get("semantic_min_similarity")
+            candidates = np.argsort(similarities)[::-1][:SEMANTIC_CANDIDATES]
+            for row in candidates:
+                similarity = float(similarities[row])
+                if similarity < min_similarity:
+                    break
+                stored_question, answer, stored_terms, stored_context = self._entries[row]
+                if stored_terms == terms and stored_context == context:
+                    return Match(stored_question, answer, similarity)
+        return None
+
+def create_semantic_index():
+    """SemanticIndex if it's turned on and NumPy is installed, else None"""
+    if not config.get("semantic_enabled"):
+        return None
+    if np is None:
+        print("Warning: NumPy not found. Answers to similar questions won't be reused.")
+        return None
+    return SemanticIndex()
@@ -0,0 +1,184 @@
+"""Timing spans for the hot path, written as a Chrome trace
+
+Wrap a step in ``with span("image.encode"):`` to time it. With trace_enabled
+the spans are appended to trace.json in trace_dir, which can be opened in
+chrome://tracing or https://ui.perfetto.dev; the file is rotated once it
+reaches trace_max_bytes. The latest duration of every span is also kept in
+memory for the overlay's performance HUD.
+
+When neither is switched on span() returns a shared no-op object, so the
+instrumentation costs next to nothing.
+"""
+import os
+import json
+import time
+import threading
+from collections import deque
+from pathlib import Path
+
+from .config import config
+
+TRACE_FLUSH_INTERVAL = 1.0  # Seconds between writes of buffered events
+TRACE_MAX_BUFFERED = 50000  # Events kept if the writer falls behind
+
+class _NullSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def set(self, **args):
+        pass
+
+NULL_SPAN = _NullSpan()
+
+class Span:
+    """One timed step; extra details can be attached with set()"""
+    __slots__ = ("tracer", "name", "category", "args", "start")
+
+    def __init__(self, tracer, name, category, args):
+        self.tracer = tracer
+        self.name = name
+        self.category = category
+        self.args = args
+        self.start = None
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.tracer.complete(self.name, self.category, self.start, time.perf_counter(), self.args)
+        return False
+
+    def set(self, **args):
+        self.args.update(args)
+
+class Tracer:
+    """Collects spans and counters from any thread"""
+    def __init__(self):
+        self.hud_active = False  # The HUD needs the numbers even without a trace file
+        self.latest = {}  # Span or counter name -> latest value in ms
+        self._pid = os.getpid()
+        self._origin = time.perf_counter()
+        self._events = deque(maxlen=TRACE_MAX_BUFFERED)
+        self._thread_names = {}
+        self._writer = None
+        self._lock = threading.Lock()
+
+    @property
+    def recording(self):
+        return self.hud_active or config.get("trace_enabled")
+
+    def span(self, name, category="app", **args):
+        if not self.recording:
+            return NULL_SPAN
+        return Span(self, name, category, args)
+
+    def complete(self, name, category, start, end, args=None):
+        """Record a span that ran from start to end (perf_counter seconds)"""
+        self.latest[name] = (end - start) * 1000
+        if config.get("trace_enabled"):
+            self._emit({
+                "name": name, "cat": category, "ph": "X",
+                "ts": self._timestamp(start), "dur": round((end - start) * 1e6, 1),
+                "pid": self._pid, "tid": self._thread_id(), "args": args or {}
+            })
+
+    def counter(self, name, value):
+        """Record a value over time, e.g. frame time in ms"""
+        if not self.recording:
+            return
+        self.latest[name] = value
+        if config.get("trace_enabled"):
+            self._emit({
+                "name": name, "ph": "C", "ts": self._timestamp(time.perf_counter()),
+                "pid": self._pid, "args": {"value": round(value, 3)}
+            })
+
+    def flush(self):
+        """Write everything buffered so far (e.g. before exiting)"""
+        if self._writer is not None:
+            self._writer.flush()
+
+    def _timestamp(self, seconds):
+        return round((seconds - self._origin) * 1e6, 1)
+
+    def _thread_id(self):
+        tid = threading.get_ident()
+        if tid not in self._thread_names:
+            self._thread_names[tid] = threading.current_thread().name
+        return tid
+
+    def _emit(self, event):
+        self._events.append(event)
+        if self._writer is None:
+            with self._lock:
+                if self._writer is None:
+                    self._writer = TraceWriter(self._events, self._pid, self._thread_names)
+
+class TraceWriter:
+    """Background thread that appends buffered events to the rotating trace file"""
+    def __init__(self, events, pid, thread_names):
+        self.events = events
+        self.pid = pid
+        self.thread_names = thread_names
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run, name="TraceWriter", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            time.sleep(TRACE_FLUSH_INTERVAL)
+            try:
+                self.flush()
+            except OSError as e:
+                print(f"Failed to write trace: {e}")
+
+    def flush(self):
+        with self._lock:
+            lines = []
+            while True:
+                try:
+                    lines.append(json.dumps(self.events.popleft()))
+                except IndexError:
+                    break
+            if not lines:
+                return
+            directory = Path(config.get("trace_dir"))
+            directory.mkdir(parents=True, exist_ok=True)
+            path = directory / "trace.json"
+            self._rotate(path)
+            with open(path, "a", encoding="utf-8") as f:
+                if f.tell() == 0:
+                    # Chrome's JSON array format; the closing bracket is optional.
+                    # Every file names the threads so the viewer labels their rows
+                    f.write("[\n")
+                    for tid, name in list(self.thread_names.items()):
+                        f.write(json.dumps({"name": "thread_name", "ph": "M", "pid": self.pid,
+                                            "tid": tid, "args": {"name": name}}) + ",\n")
+                f.write(",\n".join(lines) + ",\n")
+
+    def _rotate(self, path):
+        try:
+            if path.stat().st_size < config.get("trace_max_bytes"):
+                return
+        except FileNotFoundError:
+            return
+        # trace.json -> trace.1.json -> trace.2.json ..., dropping the oldest
+        keep = config.get("trace_max_files")
+        if keep <= 1:
+            path.unlink()
+            return
+        for index in range(keep - 2, 0, -1):
+            older = path.with_name(f"trace.{index}.json")
+            if older.exists():
+                older.replace(path.with_name(f"trace.{index + 1}.json"))
+        path.replace(path.with_name("trace.1.json"))
+
+tracer = Tracer()
+
+def span(name, category="app", **args):
+    """Context manager that times a step: with span("api.request", model=model): ..."""
+    return tracer.span(name, category, **args)
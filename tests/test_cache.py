@@ -0,0 +1,32 @@
+from PIL import Image, ImageDraw
+
+from study_helper_core.cache import capture_thumbnail, perceptual_hash, PerceptualIndex
+
+def text_page(question):
+    page = Image.new("RGB", (600, 200), (250, 250, 250))
+    draw = ImageDraw.Draw(page)
+    draw.text((40, 40), question, fill=(20, 20, 20))
+    draw.text((40, 70), "Show all of your working", fill=(20, 20, 20))
+    return page
+
+def add_snip(index, snip, cache_key):
+    thumbnail = capture_thumbnail(snip, text=True)
+    index.add(perceptual_hash(thumbnail), snip.size, cache_key, thumbnail, text=True)
+
+def lookup_snip(index, snip):
+    thumbnail = capture_thumbnail(snip, text=True)
+    return index.lookup(perceptual_hash(thumbnail), snip.size, thumbnail, text=True)
+
+def test_text_snip_matches_when_resnipped_with_a_different_border():
+    index = PerceptualIndex(max_distance=4)
+    add_snip(index, text_page("Solve for x: 2x + 3 = 11").crop((20, 20, 400, 120)), "first")
+
+    resnip = text_page("Solve for x: 2x + 3 = 11").crop((21, 18, 402, 121))
+    assert lookup_snip(index, resnip) == "first"
+
+def test_text_snip_with_a_different_number_does_not_match():
+    index = PerceptualIndex(max_distance=4)
+    add_snip(index, text_page("Solve for x: 2x + 3 = 11").crop((20, 20, 400, 120)), "first")
+
+    other = text_page("Solve for x: 2x + 5 = 11").crop((20, 20, 400, 120))
+    assert lookup_snip(index, other) is None
@@ -0,0 +1,14 @@
+from study_helper_core.context import ConversationContext
+from study_helper_core.prompts import build_text_messages
+
+def test_build_terminates_when_first_answer_has_no_sentence_break():
+    # shorten() returns limit + 3 characters here, which used to loop forever
+    conversation = ConversationContext(build_text_messages("What is 2 + 2"))
+    conversation.add_assistant("word " * 300)
+    conversation.add_user("pasted " * 5000)
+
+    messages = conversation.build(budget=1000)
+
+    assert messages[2]["content"].endswith("...")
+    assert len(messages[2]["content"]) <= 603
+    assert messages[-1]["role"] == "user"